@@ -1,18 +1,25 @@
 # -*- coding: utf-8 -*-
 import json
 import logging
+import multiprocessing
 import os
 import random
 import sys
+import time
 from collections import OrderedDict
 from pprint import pprint
 
 import settings
-from astrobox.space_field import SpaceField
 import importlib
 import argparse
 
-from models import Player, init_db
+from battle_cache import BattleCache
+from battle_field import BattleField
+from hangar_index import HangarIndex, module_to_import
+from models import init_db
+from module_state import state_keeper
+from rating_index import RatingIndex
+from team_profiler import TeamProfiler
 
 
 def get_user_answer(prompt, valid_values=None):
@@ -30,53 +37,173 @@ def get_user_answer(prompt, valid_values=None):
 
 
 def players_choose():
-    hangars = [x for x in os.listdir(settings.PROJECT_PATH) if 'hangar' in x]
+    hangar_index = HangarIndex()
+    hangars = hangar_index.hangars()
     if not hangars:
         raise ValueError(f'No hangars in {settings.PROJECT_PATH}')
     for index, path in enumerate(hangars):
         print(f'\t {index} - {path}')
     choice = get_user_answer('Номер директории для подгрузки кода', range(len(hangars)))
     number_of_players = get_user_answer('Количество игроков', range(1, 5))
-    hangar_path = hangars[choice] if os.path.exists(os.path.join(settings.PROJECT_PATH, hangars[choice])) else None
-    players_to_add = [x for x in os.listdir(os.path.join(settings.PROJECT_PATH, hangar_path)) if '__' not in x]
+    # сломанные модули и модули без drone_class не предлагаются
+    players_to_add = hangar_index.valid_modules(hangar_index.modules(hangar=hangars[choice]))
     added_players = []
     if players_to_add:
         for number in range(1, number_of_players + 1):
             for index, path in enumerate(players_to_add):
-                print(f'\t {index} - {path}')
+                print(f'\t {index} - {os.path.basename(path)}')
             player_number = get_user_answer(f"Выберите игрока №{number}", range(len(players_to_add)))
-            name = players_to_add.pop(player_number)
-            added_players.append(os.path.join(hangar_path, name))
+            added_players.append(players_to_add.pop(player_number))
     else:
         print('Ангар пуст.')
         return None
     return added_players
 
 
-def run_battle(player_modules, speed=150, asteroids_count=50, drones_count=5, show_screen=False):
-    scene = SpaceField(
+def get_hangar_modules():
+    """ Все модули команд из ангаров в формате hangar_XXXX/module_name.py """
+    hangar_index = HangarIndex()
+    modules = hangar_index.modules()
+    hangar_index.save()
+    return modules
+
+
+def seed_random(seed):
+    """ Фиксирует генераторы случайных чисел движка и дронов (модуль random и numpy, если он загружен) """
+    random.seed(seed)
+    numpy = sys.modules.get('numpy')
+    if numpy is not None:
+        numpy.random.seed(seed % 2 ** 32)
+
+
+def run_battle(player_modules, speed=150, asteroids_count=50, drones_count=5, show_screen=False, seed=None,
+               decided_check_interval=100, fast_forward=False, cpu_budget=None, profile=False, phase_times=None):
+    """
+    Проводит битву команд из player_modules и возвращает ее результат.
+    Обработчики событий команд замеряются (TeamProfiler) только если задан cpu_budget или profile,
+    тогда в результате есть блок timing.
+    Если передан словарь phase_times, в него записывается время этапов битвы:
+    import (импорт модулей дронов), scene_build (создание поля и дронов), simulation (сама битва).
+    """
+    started_at = time.perf_counter()
+    drone_modules = []
+    for team_module in player_modules:
+        drone_module = importlib.import_module(module_to_import(team_module))
+        if not hasattr(drone_module, 'drone_class'):
+            raise ValueError(f'In module {team_module} no variable drone_class: cant import drones!!!')
+        drone_modules.append(drone_module)
+    # модули могли остаться от предыдущей битвы в этом же процессе - возвращаем их в исходное состояние
+    state_keeper.track_new_modules()
+    state_keeper.restore()
+    imported_at = time.perf_counter()
+    if seed is not None:
+        seed_random(seed)
+    scene = BattleField(
         speed=speed,
         field=(1200, 1200),
         asteroids_count=asteroids_count,
         can_fight=True,
         headless=not show_screen,
+        decided_check_interval=decided_check_interval,
+        fast_forward=fast_forward and not show_screen,
     )
     scene._Scene__teams = OrderedDict()
     drones_teams = {}
     drones_paths = {}
-    for i, team_module in enumerate(player_modules):
-        module_to_import = team_module.replace('.py', '').replace('/', '.').replace('\\', '.')
-        drone_module = importlib.import_module(module_to_import)
-        if not hasattr(drone_module, 'drone_class'):
-            raise ValueError(f'In module {team_module} no variable drone_class: cant import drones!!!')
+    profiler = TeamProfiler(cpu_budget=cpu_budget) if profile or cpu_budget is not None else None
+    for i, (team_module, drone_module) in enumerate(zip(player_modules, drone_modules)):
         drone = drone_module.drone_class
         drones_paths[drone.__name__] = team_module
         drones_teams[i] = [drone() for _ in range(drones_count)]
+        if profiler:
+            for team_drone in drones_teams[i]:
+                profiler.watch(team_drone)
+    built_at = time.perf_counter()
     battle_result = scene.go()
+    if phase_times is not None:
+        phase_times['import'] = imported_at - started_at
+        phase_times['scene_build'] = built_at - imported_at
+        phase_times['simulation'] = time.perf_counter() - built_at
     battle_result['players_modules'] = drones_paths
+    if profiler:
+        battle_result['timing'] = profiler.get_stats()
+    if cpu_budget is not None:
+        battle_result['forfeited'] = profiler.forfeited
+    if seed is not None:
+        battle_result['seed'] = seed
     return battle_result
 
 
+def run_cached_battle(cache, **spec):
+    """ Возвращает результат битвы из кеша, если такая битва (с тем же seed) уже проводилась и воспроизвелась """
+    result = cache.get(spec)
+    if result:
+        logging.info(f'Битва {spec} взята из кеша')
+        return result
+    result = run_battle(**spec)
+    cache.put(spec, result)
+    return result
+
+
+def _run_battle_spec(spec):
+    try:
+        return spec, run_battle(**spec)
+    except Exception:
+        logging.exception(f'Битва {spec} завершилась с ошибкой')
+        return spec, None
+
+
+def run_battles(specs, workers=None, fork_server=False, cache=None):
+    """
+    Запускает пачку битв в пуле процессов, без экрана.
+    Каждая спецификация - словарь аргументов для run_battle (player_modules, speed, asteroids_count, ...).
+    Результаты отдаются по мере завершения битв, упавшие битвы пропускаются.
+    В режиме fork_server движок и все модули ангаров импортируются один раз в процессе-шаблоне,
+    а под каждую битву из него форкается свежий процесс.
+    Если передан cache, битвы с seed, уже сыгранные раньше с одинаковым исходом, не пересчитываются.
+    """
+    specs = [dict(spec, show_screen=False) for spec in specs]
+    if cache:
+        not_cached_specs = []
+        for spec in specs:
+            result = cache.get(spec)
+            if result:
+                yield result
+            else:
+                not_cached_specs.append(spec)
+        specs = not_cached_specs
+    if not specs:
+        return
+    workers = workers or os.cpu_count()
+    if fork_server:
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['fork_server'])
+        pool = context.Pool(processes=workers, maxtasksperchild=1)
+    else:
+        # состояние модулей дронов восстанавливается перед каждой битвой, так что процессы переиспользуются
+        pool = multiprocessing.Pool(processes=workers)
+    with pool:
+        for spec, result in pool.imap_unordered(_run_battle_spec, specs):
+            if result:
+                if cache:
+                    cache.put(spec, result)
+                yield result
+
+
+def load_battle_specs(path, workers=None):
+    """ Битвы из json-файла, битвы со сломанными модулями (см. HangarIndex) пропускаются сразу """
+    with open(path, 'r') as ff:
+        specs = json.load(ff)
+    for spec in specs:
+        if 'player_modules' not in spec:
+            raise ValueError(f'Battle spec {spec} must contain player_modules')
+        if not _modules_exists(spec['player_modules']):
+            raise ValueError(f'No one of modules: {spec["player_modules"]}')
+    team_modules = sorted({team_module for spec in specs for team_module in spec['player_modules']})
+    valid_modules = set(HangarIndex(workers=workers).valid_modules(team_modules))
+    return [spec for spec in specs if valid_modules.issuperset(spec['player_modules'])]
+
+
 def print_battle_result(result):
     print('')
     print(f'Battle result:')
@@ -84,34 +211,37 @@ def print_battle_result(result):
 
 
 def save_battle_result(result, path):
-    with open(path, 'w') as ff:
+    # через временный файл, чтобы renew_rating.py --watch не прочитал недописанный результат
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'w') as ff:
         ff.write(json.dumps(result, indent=1))
+    os.replace(tmp_path, path)
     print('')
     print(f'Battle result saved to {path}')
 
 
-def get_tournament_players(player_module):
+def get_tournament_players(player_module, seed=None, rating_index=None):
+    """
+    Соперники для игрока: по возможности один сильнее, двое примерно равных и слабее.
+    Для подбора многих турниров подряд стоит передать заранее загруженный rating_index.
+    """
+    rnd = random.Random(seed)
     if '.py' not in player_module:
         raise ValueError("Param player_module must be kind of 'hangar_XXXX/student_module.py'")
-    player = Player.get_or_none(path=player_module)
+    if rating_index is None:
+        rating_index = RatingIndex.load()
+    player = rating_index.get_by_path(player_module)
     if not player:
         raise ValueError(f"No player with path {player_module} in database! Try renew_rating")
     candidates = [player, ]
-    top_players = Player.select().filter(
-        Player.rating > player.rating * 1.1
-    ).order_by(Player.rating.asc()).limit(4)
-    bottom_players = Player.select().filter(
-        Player.rating < player.rating * 0.9
-    ).order_by(Player.rating.desc()).limit(4)
-    similar_players = Player.select().filter(
-        (Player.rating <= player.rating * 1.1) &
-        (Player.rating >= player.rating * 0.9) &
-        (Player.id != player.id)
-    )
-
-    similar_players = list(similar_players) if similar_players else []
-    top_players = list(top_players) if top_players else []
-    bottom_players = list(bottom_players) if bottom_players else []
+    # границы полосы, как их раньше округлял peewee для целочисленного поля рейтинга
+    low_rating, high_rating = int(player.rating * 0.9), int(player.rating * 1.1)
+    top_players = rating_index.above(high_rating, limit=4)
+    bottom_players = rating_index.below(low_rating, limit=4)
+    similar_players = [
+        similar_player for similar_player in rating_index.between(low_rating, high_rating)
+        if similar_player.id != player.id
+    ]
     top_players.sort(key=lambda x: x.rating)
 
     number_top_players = min(len(top_players), 1)
@@ -131,11 +261,11 @@ def get_tournament_players(player_module):
                      *similar_players[number_similar_players:],
                      *bottom_players[number_bottom_players:]]
 
-    random.shuffle(other_players)
+    rnd.shuffle(other_players)
     player_lists.append(other_players[:number_other_players])
 
     while len(candidates) <= 4:
-        random.shuffle(similar_players)
+        rnd.shuffle(similar_players)
         for _players in player_lists:
             candidate = _players.pop() if _players else None
             if candidate:
@@ -146,11 +276,10 @@ def get_tournament_players(player_module):
 
 
 def _modules_exists(modules):
-    for module in modules:
-        full_path = os.path.join(settings.PROJECT_PATH, module)
-        if not os.path.exists(full_path):
-            return False
-    return True
+    hangar_index = HangarIndex()
+    exists = all(hangar_index.exists(module) for module in modules)
+    hangar_index.save()
+    return exists
 
 
 if __name__ == '__main__':
@@ -171,6 +300,31 @@ if __name__ == '__main__':
     parser.add_argument('-c', '--show-screen', action='store_true', help='показать экран битвы')
     parser.add_argument('-b', '--database', type=str, default=settings.DB_URL,
                         help=f'URL соединения с БД (если не указано то {settings.DB_URL})')
+    parser.add_argument('--batch', type=str,
+                        help='Путь до json-файла со списком битв, например '
+                             '[{"player_modules": ["hangar_2019/module_1.py", "hangar_2020/module_2.py"]}], '
+                             'битвы запускаются параллельно без экрана')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='Количество процессов для режима --batch')
+    parser.add_argument('--fork-server', action='store_true',
+                        help='В режиме --batch импортировать движок и ангары один раз '
+                             'и запускать каждую битву в форке подготовленного процесса')
+    parser.add_argument('-e', '--decided-check-interval', type=int, default=100,
+                        help='Раз во сколько шагов проверять, что итог битвы уже не изменится, '
+                             'чтобы закончить ее досрочно (0 - не проверять)')
+    parser.add_argument('-f', '--fast-forward', action='store_true',
+                        help='Прокручивать битву без экрана с максимальной скоростью (результат тот же при том же seed)')
+    parser.add_argument('--cpu-budget', type=float,
+                        help='Бюджет процессорного времени (секунд) на обработчики событий команды за битву, '
+                             'превысившая его команда снимается с битвы')
+    parser.add_argument('--profile', action='store_true',
+                        help='Замерять процессорное время обработчиков событий команд (блок timing в результате)')
+    parser.add_argument('--seed', type=int,
+                        help='Зерно генератора случайных чисел: расстановка астероидов, подбор соперников '
+                             'и случайность в коде дронов. В режиме --batch битве номер N достается seed + N')
+    parser.add_argument('--cache-dir', type=str, default=settings.BATTLE_CACHE_DIR,
+                        help=f'Папка кеша результатов битв с seed (если не указано то {settings.BATTLE_CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true', help='Не использовать кеш результатов битв')
     parser.add_argument('-t', '--tournament', type=str,
                         help='Режим турнира для указанного игрока (путь до модуля), '
                              'остальные 3 игрока выбираются автоматически по рейтингу: '
@@ -178,11 +332,32 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
     init_db(db_url=args.database)
+    battle_cache = None if args.no_cache else BattleCache(args.cache_dir)
+    if args.batch:
+        specs = load_battle_specs(args.batch, workers=args.workers)
+        for index, spec in enumerate(specs):
+            spec.setdefault('speed', args.game_speed)
+            spec.setdefault('asteroids_count', args.asteroids_count)
+            spec.setdefault('drones_count', args.drones_count)
+            spec.setdefault('decided_check_interval', args.decided_check_interval)
+            spec.setdefault('fast_forward', args.fast_forward)
+            spec.setdefault('cpu_budget', args.cpu_budget)
+            spec.setdefault('profile', args.profile)
+            if args.seed is not None:
+                spec.setdefault('seed', args.seed + index)
+        for result in run_battles(specs, workers=args.workers, fork_server=args.fork_server, cache=battle_cache):
+            if args.out_dir:
+                os.makedirs(args.out_dir, exist_ok=True)
+                path = os.path.join(args.out_dir, f"{result['uuid']}.json")
+                save_battle_result(result=result, path=path)
+            else:
+                print_battle_result(result=result)
+        sys.exit(0)
     if args.tournament:
         if not _modules_exists([args.tournament, ]):
             logging.error(f'No module {args.tournament}')
             sys.exit(1)
-        players = get_tournament_players(args.tournament)
+        players = get_tournament_players(args.tournament, seed=args.seed)
     elif args.player_module:
         if not _modules_exists(args.player_module):
             logging.error(f'No one of modules: {args.player_module}')
@@ -191,9 +366,15 @@ if __name__ == '__main__':
     else:
         players = players_choose()
     try:
-        result = run_battle(player_modules=players, speed=args.game_speed,
-                            asteroids_count=args.asteroids_count, drones_count=args.drones_count,
-                            show_screen=args.show_screen)
+        battle_spec = dict(player_modules=players, speed=args.game_speed,
+                           asteroids_count=args.asteroids_count, drones_count=args.drones_count,
+                           show_screen=args.show_screen, seed=args.seed,
+                           decided_check_interval=args.decided_check_interval,
+                           fast_forward=args.fast_forward, cpu_budget=args.cpu_budget, profile=args.profile)
+        if battle_cache:
+            result = run_cached_battle(battle_cache, **battle_spec)
+        else:
+            result = run_battle(**battle_spec)
         if result:
             if args.out_file:
                 save_battle_result(result=result, path=args.out_file)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+import os
+
+from hangar_index import HangarIndex
+
+# версия ключа: записи прежних версий кеша (без проверки воспроизводимости) не используются
+CACHE_VERSION = 2
+# поля результата, которые должны совпасть у двух битв с одним ключом
+OUTCOME_FIELDS = ('game_steps', 'collected', 'dead', 'forfeited')
+
+
+class BattleCache:
+    """
+    Кеш результатов битв, адресуемый по содержимому:
+    ключ строится из seed, хешей исходников модулей команд, скорости, количества астероидов и дронов,
+    интервала проверки досрочного окончания (от него зависит game_steps) и бюджета времени команд.
+    fast_forward и show_screen в ключ намеренно не входят: они меняют только то, как крутится игровой цикл,
+    ход битвы и результат с тем же seed одинаковы.
+    Кешируются только битвы с явно заданным seed - без него результат не воспроизводим.
+    Битвы с замером времени обработчиков (profile) не кешируются: замер нужен по реально сыгранной битве.
+    Но и с seed не все команды играют одинаково (например, обходят множество объектов игры, а порядок обхода
+    меняется от запуска к запуску), поэтому результат отдается из кеша, только когда битва уже дважды дала
+    одинаковый исход (OUTCOME_FIELDS). Если исходы разошлись, битва с таким ключом больше не кешируется.
+    Хеши исходников берутся из индекса ангаров (HangarIndex) и не пересчитываются для неизмененных модулей.
+    """
+
+    def __init__(self, path, hangar_index=None):
+        self.path = path
+        self.hangar_index = hangar_index or HangarIndex()
+        self._hashes = {}
+
+    def _source_hash(self, team_module):
+        if team_module not in self._hashes:
+            self._hashes[team_module] = self.hangar_index.source_hash(team_module)
+            self.hangar_index.save()
+        return self._hashes[team_module]
+
+    def key(self, player_modules, seed=None, speed=150, asteroids_count=50, drones_count=5,
+            decided_check_interval=100, cpu_budget=None, profile=False, **kwargs):
+        if seed is None or profile:
+            return None
+        key_data = dict(
+            version=CACHE_VERSION,
+            seed=seed,
+            sources=[self._source_hash(team_module) for team_module in player_modules],
+            speed=speed,
+            asteroids_count=asteroids_count,
+            drones_count=drones_count,
+            decided_check_interval=decided_check_interval,
+            cpu_budget=cpu_budget,
+        )
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def _file_name(self, key, extension='json'):
+        return os.path.join(self.path, key[:2], f'{key}.{extension}')
+
+    @staticmethod
+    def _read(file_name):
+        try:
+            with open(file_name, 'r') as ff:
+                return json.load(ff)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write(file_name, data):
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        tmp_file_name = f'{file_name}.tmp{os.getpid()}'
+        with open(tmp_file_name, 'w') as ff:
+            ff.write(json.dumps(data, indent=1))
+        os.replace(tmp_file_name, file_name)
+
+    def get(self, spec):
+        """ Результат битвы, если он уже подтвержден повторной битвой, иначе None """
+        key = self.key(**spec)
+        if key is None:
+            return None
+        return self._read(self._file_name(key))
+
+    def put(self, spec, result):
+        """
+        Первый результат битвы откладывается до повтора, второй сверяется с ним:
+        совпал исход - результат кешируется, не совпал - битва с этим ключом больше не кешируется.
+        """
+        key = self.key(**spec)
+        if key is None:
+            return
+        file_name = self._file_name(key)
+        unstable_file_name = self._file_name(key, extension='unstable')
+        if os.path.exists(file_name) or os.path.exists(unstable_file_name):
+            return
+        pending_file_name = self._file_name(key, extension='pending')
+        pending = self._read(pending_file_name)
+        if pending is None:
+            self._write(pending_file_name, result)
+            return
+        if all(pending.get(field) == result.get(field) for field in OUTCOME_FIELDS):
+            self._write(file_name, pending)
+        else:
+            logging.warning(f'Битва {spec} с тем же seed дала другой результат, в кеш она больше не попадет')
+            self._write(unstable_file_name, [pending, result])
+        os.remove(pending_file_name)
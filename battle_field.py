@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+from collections import defaultdict
+from contextlib import contextmanager
+from queue import Queue, SimpleQueue
+
+from astrobox.space_field import SpaceField
+from astrobox.theme import theme
+from robogame_engine.utils import CanLogging
+
+
+def _skip_log(self, pattern, *args, **kwargs):
+    pass
+
+
+@contextmanager
+def _quiet_engine_logging():
+    """ Отключает вызовы debug/info движка, если они все равно ничего не пишут """
+    logger = logging.getLogger('robogame')
+    if logger.level <= logging.INFO:
+        yield
+        return
+    debug, info = CanLogging.debug, CanLogging.info
+    CanLogging.debug = CanLogging.info = _skip_log
+    try:
+        yield
+    finally:
+        CanLogging.debug, CanLogging.info = debug, info
+
+
+def _to_simple_queue(queue):
+    simple_queue = SimpleQueue()
+    while not queue.empty():
+        simple_queue.put(queue.get())
+    return simple_queue
+
+
+class BattleField(SpaceField):
+    """
+    Поле битвы для турниров.
+    Раз в decided_check_interval шагов проверяет, может ли еще измениться итог битвы,
+    и если нет - заканчивает битву досрочно, не дожидаясь обратного отсчета движка.
+
+    В режиме fast_forward (только без экрана) игровой цикл крутится без UI, пауз и логирования шагов,
+    а очереди событий и команд объектов заменяются на более легкие SimpleQueue.
+    Физика и порядок событий не меняются, поэтому при одинаковом seed результат тот же.
+    """
+
+    def __init__(self, *args, decided_check_interval=0, fast_forward=False, **kwargs):
+        self.decided_check_interval = decided_check_interval
+        self.fast_forward = fast_forward
+        super().__init__(*args, **kwargs)
+        if self.fast_forward and not self.headless:
+            raise ValueError('Fast forward mode is available only without screen')
+
+    def is_decided(self):
+        """
+        Итог битвы больше не изменится, если не осталось живых дронов,
+        либо весь элериум уже нельзя ни добыть, ни отнять:
+        астероиды пусты, на обломках и уничтоженных базах ничего нет,
+        а с грузом остались только команды, которых некому атаковать.
+        Если дроны могут стрелять, живые дроны должны остаться только у одной команды:
+        иначе они еще могут сбить друг друга, а потери команд (dead) тоже входят в результат.
+        """
+        alive_teams = {drone.team for drone in self.drones if drone.is_alive}
+        if not alive_teams:
+            return True
+        if theme.DRONES_CAN_FIGHT and len(alive_teams) > 1:
+            return False
+        if any(asteroid.payload for asteroid in self.asteroids):
+            return False
+        for unit in self.drones + self.motherships:
+            if not unit.payload:
+                continue
+            if not unit.is_alive:
+                return False
+            if theme.DRONES_CAN_FIGHT and alive_teams - {unit.team}:
+                return False
+        return True
+
+    def get_game_result(self):
+        if self.decided_check_interval and self._step and self._step % self.decided_check_interval == 0:
+            if self.is_decided():
+                _cur_state = self._get_game_state()
+                self.print_game_statistics(stats=_cur_state)
+                return True, self._make_game_result(_cur_state)
+        return super().get_game_result()
+
+    def _Scene__get_overlap_map(self):
+        """
+        То же, что Scene.__get_overlap_map, но без лишних вызовов в двойном цикле.
+        Порядок пар и значения пересечений совпадают с движком.
+        """
+        objects = self.objects
+        coords = [(obj.coord.x, obj.coord.y, obj.radius, getattr(obj, 'owner', obj)) for obj in objects]
+        overlap_map = defaultdict(list)
+        for i, left in enumerate(objects):
+            left_x, left_y, left_radius, left_owner = coords[i]
+            for j in range(i + 1, len(objects)):
+                right_x, right_y, right_radius, right_owner = coords[j]
+                right = objects[j]
+                # у кого нет owner, в coords записан он сам
+                if right_owner is not right and (right_owner is left or left_owner is right):
+                    continue
+                summ_radius = left_radius + right_radius
+                # если по одной из осей объекты дальше суммы радиусов - пересечения точно нет
+                if abs(left_x - right_x) > summ_radius or abs(left_y - right_y) > summ_radius:
+                    continue
+                distance = math.sqrt((left_x - right_x) ** 2 + (left_y - right_y) ** 2)
+                overlap_distance = int(summ_radius - distance)
+                if overlap_distance > 1:
+                    overlap_map[left].append((overlap_distance, right))
+                    overlap_map[right].append((overlap_distance, left))
+        return overlap_map
+
+    def _use_simple_queues(self):
+        for obj in self.objects:
+            if type(obj._events) is Queue:
+                obj._events = _to_simple_queue(obj._events)
+                obj._commands = _to_simple_queue(obj._commands)
+
+    def go(self):
+        if not self.fast_forward:
+            return super().go()
+        self.prepare(**self.init_kwargs)
+        with _quiet_engine_logging():
+            while True:
+                is_game_over, game_results = self.get_game_result()
+                if is_game_over:
+                    return game_results
+                self._step += 1
+                # снаряды появляются по ходу битвы
+                self._use_simple_queues()
+                self.game_step()
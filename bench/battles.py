@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Замер скорости проведения битв на реальных ангарах.
+
+Проводит фиксированный набор битв с заданными seed без экрана и печатает
+тиков в секунду, битв в минуту, пиковую память и время этапов (импорт, создание поля, битва, сериализация).
+Результат можно сохранить как эталон (--save) и сравнивать с ним следующие замеры (--compare).
+
+    python -m bench.battles --save bench/baseline.json
+    python -m bench.battles --compare bench/baseline.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import resource
+import sys
+import time
+
+from battle import run_battle
+
+MATCHUPS = (
+    dict(player_modules=['hangar_2019/kharitonov.py', 'hangar_2019/vinogradov.py'], seed=1),
+    dict(player_modules=['hangar_2019/surkova_e_n.py', 'hangar_2020/starovoitov_v_d.py',
+                         'hangar_2021/shirokov_a_s.py'], seed=2),
+    dict(player_modules=['hangar_2020/sivkov_a_v.py', 'hangar_2020/kachanov_v_a.py',
+                         'hangar_2020/martynov_v_l.py', 'hangar_2020/okhotnikov_f_n.py'], seed=3),
+    dict(player_modules=['hangar_2021/beskaev_s_a.py', 'hangar_2021/garin_m_s.py'], seed=4),
+    dict(player_modules=['hangar_2021/voychenko_n_s.py', 'hangar_2021/xvatov_N_K.py',
+                         'hangar_2021/devastator.py', 'hangar_2021/yurchenko_g_o.py'], seed=5),
+)
+PHASES = ('import', 'scene_build', 'simulation', 'serialization')
+# метрики, которые сравниваются с эталоном: имя -> больше значит лучше
+COMPARED_METRICS = {'ticks_per_second': True, 'battles_per_minute': True, 'peak_rss_mb': False}
+
+
+def peak_rss_mb():
+    # на Linux ru_maxrss в килобайтах, на macOS - в байтах
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss /= 1024
+    return round(rss / 1024, 1)
+
+
+def run_bench(asteroids_count=10, drones_count=5, speed=10, fast_forward=True):
+    battles = []
+    started_at = time.perf_counter()
+    for matchup in MATCHUPS:
+        phase_times = {}
+        result = run_battle(speed=speed, asteroids_count=asteroids_count, drones_count=drones_count,
+                            fast_forward=fast_forward, phase_times=phase_times, **matchup)
+        serialization_started_at = time.perf_counter()
+        json.dumps(result, indent=1)
+        phase_times['serialization'] = time.perf_counter() - serialization_started_at
+        battles.append(dict(
+            player_modules=matchup['player_modules'],
+            seed=matchup['seed'],
+            game_steps=result['game_steps'],
+            collected=result['collected'],
+            ticks_per_second=round(result['game_steps'] / phase_times['simulation'], 1),
+            phases={phase: round(phase_times[phase], 4) for phase in PHASES},
+        ))
+    total_time = time.perf_counter() - started_at
+    total_steps = sum(battle['game_steps'] for battle in battles)
+    total_simulation = sum(battle['phases']['simulation'] for battle in battles)
+    return dict(
+        created_at=datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        python=platform.python_version(),
+        machine=platform.machine(),
+        params=dict(asteroids_count=asteroids_count, drones_count=drones_count, speed=speed,
+                    fast_forward=fast_forward),
+        battles=battles,
+        totals=dict(
+            ticks_per_second=round(total_steps / total_simulation, 1),
+            battles_per_minute=round(len(battles) / total_time * 60, 2),
+            peak_rss_mb=peak_rss_mb(),
+            phases={phase: round(sum(battle['phases'][phase] for battle in battles), 4) for phase in PHASES},
+        ),
+    )
+
+
+def print_report(report):
+    print()
+    print(f"{'Битва':<80}{'шагов':>8}{'тиков/с':>10}" + ''.join(f'{phase:>14}' for phase in PHASES))
+    for battle in report['battles']:
+        name = ' vs '.join(module.split('/')[-1].replace('.py', '') for module in battle['player_modules'])
+        print(f"{name:<80}{battle['game_steps']:>8}{battle['ticks_per_second']:>10}"
+              + ''.join(f"{battle['phases'][phase]:>14.3f}" for phase in PHASES))
+    totals = report['totals']
+    print()
+    print(f"Тиков в секунду: {totals['ticks_per_second']}")
+    print(f"Битв в минуту: {totals['battles_per_minute']}")
+    print(f"Пиковая память: {totals['peak_rss_mb']} Мб")
+    print('Время этапов: ' + ', '.join(f'{phase} {totals["phases"][phase]:.3f} с' for phase in PHASES))
+
+
+def compare_with_baseline(report, baseline, tolerance):
+    """ Возвращает список регрессий относительно эталона (хуже более чем на tolerance процентов) """
+    regressions = []
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        current, base = report['totals'][metric], baseline['totals'][metric]
+        change = (current - base) / base * 100 if base else 0
+        print(f'{metric}: {base} -> {round(current, 2)} ({change:+.1f}%)')
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(metric)
+    for battle, base_battle in zip(report['battles'], baseline['battles']):
+        if battle['collected'] != base_battle['collected']:
+            print(f"Результат битвы {battle['player_modules']} изменился: "
+                  f"{base_battle['collected']} -> {battle['collected']}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Замер скорости проведения битв на фиксированном наборе битв')
+    parser.add_argument('-a', '--asteroids-count', type=int, default=10, help='Количество астероидов')
+    parser.add_argument('-d', '--drones-count', type=int, default=5, help='Количество дронов в команде')
+    parser.add_argument('-s', '--game-speed', type=int, default=10, help='Скорость битвы')
+    parser.add_argument('--no-fast-forward', action='store_true', help='Использовать обычный игровой цикл движка')
+    parser.add_argument('--save', type=str, help='Сохранить результат замера в json-файл как эталон')
+    parser.add_argument('--compare', type=str, help='Сравнить с эталоном из json-файла')
+    parser.add_argument('--tolerance', type=float, default=10,
+                        help='Допустимое ухудшение метрик относительно эталона, в процентах')
+    args = parser.parse_args()
+
+    bench_report = run_bench(asteroids_count=args.asteroids_count, drones_count=args.drones_count,
+                             speed=args.game_speed, fast_forward=not args.no_fast_forward)
+    print_report(bench_report)
+    if args.save:
+        with open(args.save, 'w') as ff:
+            ff.write(json.dumps(bench_report, indent=1))
+        print(f'Результат замера сохранен в {args.save}')
+    if args.compare:
+        with open(args.compare, 'r') as ff:
+            bench_baseline = json.load(ff)
+        print()
+        found_regressions = compare_with_baseline(bench_report, bench_baseline, tolerance=args.tolerance)
+        if found_regressions:
+            print(f'Регрессия: {", ".join(found_regressions)}')
+            sys.exit(1)
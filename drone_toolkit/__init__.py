@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+Общие инструменты для команд дронов: то, что почти каждая команда пишет сама.
+
+    from drone_toolkit import CollectorPlanner, SpatialGrid, WorldSnapshot, geometry, line_of_fire
+"""
+from drone_toolkit import geometry, line_of_fire
+from drone_toolkit.assignment import CollectorPlanner
+from drone_toolkit.spatial import SpatialGrid
+from drone_toolkit.world import TeamView, WorldSnapshot
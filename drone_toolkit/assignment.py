@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Распределение сборщиков по источникам элериума (астероидам, обломкам) для всей команды сразу.
+
+Вместо того чтобы каждый дрон по очереди брал ближайший свободный астероид и команда потом разбиралась
+со списками занятых, задача решается как задача о назначениях (венгерский алгоритм): каждому дрону -
+источник, а сумма затрат (время полета за единицу элериума) минимальна по всей команде.
+
+    planner = CollectorPlanner.of(self)
+    asteroid = planner.target(self)
+    ...
+    def on_load_complete(self):
+        asteroid = planner.on_load_complete(self)  # None - дрон полон или брать нечего, пора на базу
+"""
+import math
+
+import numpy as np
+
+from drone_toolkit import geometry
+from drone_toolkit.world import WorldSnapshot
+
+
+def solve(costs):
+    """
+    Назначение строк столбцам с минимальной суммой затрат (венгерский алгоритм, O(n^2 * m)).
+    costs - матрица (строки x столбцы), np.inf - назначение запрещено. Матрица может быть прямоугольной:
+    назначается min(строк, столбцов) пар. Возвращает массивы номеров строк и столбцов назначенных пар,
+    строки по возрастанию; пары с запрещенными назначениями в ответ не попадают.
+    """
+    costs = np.asarray(costs, dtype=float)
+    if not costs.size:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    transposed = costs.shape[0] > costs.shape[1]
+    if transposed:
+        costs = costs.T
+    allowed = np.isfinite(costs)
+    if not allowed.any():
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    finite = costs[allowed]
+    # запрещенное назначение дороже любого набора разрешенных - выбирается, только если иначе никак
+    forbidden_cost = finite.max() + (finite.max() - finite.min() + 1) * costs.shape[0]
+    matrix = np.where(allowed, costs, forbidden_cost)
+    rows, columns = matrix.shape
+    # потенциалы строк и столбцов, нулевой столбец - фиктивный, с него начинается поиск для новой строки
+    row_potentials, column_potentials = np.zeros(rows + 1), np.zeros(columns + 1)
+    owners = np.zeros(columns + 1, dtype=int)  # строка (с 1), которой отдан столбец, 0 - столбец свободен
+    way = np.zeros(columns + 1, dtype=int)
+    for row in range(1, rows + 1):
+        owners[0] = row
+        column = 0
+        min_reduced = np.full(columns + 1, np.inf)
+        used = np.zeros(columns + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current_row = owners[column]
+            free = ~used[1:]
+            reduced = matrix[current_row - 1] - row_potentials[current_row] - column_potentials[1:]
+            improved = free & (reduced < min_reduced[1:])
+            min_reduced[1:][improved] = reduced[improved]
+            way[1:][improved] = column
+            candidates = np.where(free, min_reduced[1:], np.inf)
+            next_column = int(np.argmin(candidates)) + 1
+            delta = candidates[next_column - 1]
+            row_potentials[owners[used]] += delta
+            column_potentials[used] -= delta
+            min_reduced[1:][free] -= delta
+            column = next_column
+            if not owners[column]:
+                break
+        # увеличивающая цепочка: столбцы переходят к строкам, пока не освободится путь до фиктивного
+        while column:
+            previous = way[column]
+            owners[column] = owners[previous]
+            column = previous
+    assigned_columns = np.nonzero(owners[1:])[0]
+    assigned_rows = owners[1:][assigned_columns] - 1
+    keep = allowed[assigned_rows, assigned_columns]
+    assigned_rows, assigned_columns = assigned_rows[keep], assigned_columns[keep]
+    if transposed:
+        assigned_rows, assigned_columns = assigned_columns, assigned_rows
+    order = np.argsort(assigned_rows)
+    return assigned_rows[order], assigned_columns[order]
+
+
+def collection_costs(drones, free_spaces, sources, amounts, bases):
+    """
+    Затраты сборщиков на источники: путь дрона до источника и от источника до своей базы на единицу
+    элериума, который дрон оттуда заберет (min(свободное место, сколько можно взять с источника)).
+    drones, bases - точки по дронам, sources - точки источников, free_spaces и amounts - числа.
+    Форма (len(drones), len(sources)), np.inf - взять нечего.
+    """
+    drones, sources, bases = geometry.as_points(drones), geometry.as_points(sources), geometry.as_points(bases)
+    to_source = geometry.distance_matrix(drones, sources)
+    to_base = np.sqrt(((sources[None, :, :] - bases[:, None, :]) ** 2).sum(axis=2))
+    taken = np.minimum(np.asarray(free_spaces, dtype=float)[:, None], np.asarray(amounts, dtype=float)[None, :])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(taken > 0, (to_source + to_base) / taken, np.inf)
+
+
+class CollectorPlanner:
+    """
+    План сборки элериума одной команды: какой дрон к какому источнику летит и сколько рассчитывает взять.
+    Общий для всех дронов команды в битве (CollectorPlanner.of(drone)).
+
+    Полное решение задачи о назначениях - при первом запросе и при смене состава сборщиков
+    (новый дрон, гибель, release) или по вызову replan(). Когда дрон закончил погрузку или его источник
+    опустел раньше времени, перерешивается только его строка: планы остальных дронов не меняются,
+    дрону достается лучший источник из того, что остается после их планов.
+
+    Большой источник делится на части по объему трюма, так что к нему могут быть назначены несколько дронов.
+    """
+
+    def __init__(self, team, include_wrecks=False):
+        self.team = team
+        self.include_wrecks = include_wrecks
+        # дрон -> (источник, сколько рассчитывает взять), для дронов без источника - (None, 0)
+        self._plan = {}
+        self._outdated = True
+
+    @classmethod
+    def of(cls, drone, include_wrecks=False):
+        """ План команды дрона (хранится в сцене, поэтому у каждой битвы свой) """
+        planners = getattr(drone.scene, '_collector_planners', None)
+        if planners is None:
+            planners = drone.scene._collector_planners = {}
+        planner = planners.get(drone.team)
+        if planner is None:
+            planner = planners[drone.team] = cls(drone.team, include_wrecks=include_wrecks)
+        return planner
+
+    def _sources(self, drone):
+        world = WorldSnapshot.of(drone)
+        sources = world.non_empty_asteroids
+        if self.include_wrecks:
+            sources = sources + world.wrecks
+        return [source for source in sources if source.payload > 0]
+
+    def _available(self, sources, exclude=()):
+        """ Сколько элериума на источниках остается за вычетом планов дронов (кроме exclude) """
+        available = {source: source.payload for source in sources}
+        for drone, (source, amount) in self._plan.items():
+            if drone not in exclude and source in available:
+                available[source] -= amount
+        return available
+
+    def _costs(self, drones, sources, amounts):
+        return collection_costs(
+            drones=drones,
+            free_spaces=[drone.free_space for drone in drones],
+            sources=sources,
+            amounts=amounts,
+            bases=[drone.mothership for drone in drones],
+        )
+
+    def replan(self, drones=None):
+        """ Полное перераспределение сборщиков (по умолчанию - всех живых дронов, уже бывших в плане) """
+        if drones is None:
+            drones = list(self._plan)
+        drones = [drone for drone in drones if drone.is_alive]
+        self._plan = {drone: (None, 0) for drone in drones}
+        self._outdated = False
+        collectors = [drone for drone in drones if drone.free_space > 0]
+        if not collectors:
+            return
+        sources = self._sources(collectors[0])
+        if not sources:
+            return
+        # части источников: каждая - на один трюм самого вместительного сборщика
+        capacity = max(drone.free_space for drone in collectors)
+        parts, amounts = [], []
+        for source in sources:
+            payload = source.payload
+            for part in range(min(math.ceil(payload / capacity), len(collectors))):
+                parts.append(source)
+                amounts.append(min(payload - part * capacity, capacity))
+        rows, columns = solve(self._costs(collectors, parts, amounts))
+        for row, column in zip(rows, columns):
+            drone = collectors[row]
+            self._plan[drone] = parts[column], min(drone.free_space, amounts[column])
+
+    def _assign(self, drone):
+        """ Лучший источник для одного дрона при неизменных планах остальных """
+        self._plan[drone] = None, 0
+        if drone.free_space <= 0:
+            return
+        available = self._available(self._sources(drone), exclude=(drone,))
+        available = {source: amount for source, amount in available.items() if amount > 0}
+        if not available:
+            return
+        sources = list(available)
+        costs = self._costs([drone], sources, [available[source] for source in sources])[0]
+        best = int(np.argmin(costs))
+        if np.isfinite(costs[best]):
+            self._plan[drone] = sources[best], min(drone.free_space, available[sources[best]])
+
+    def target(self, drone):
+        """ Источник, к которому летит дрон, или None - брать нечего """
+        if drone not in self._plan or any(not member.is_alive for member in self._plan):
+            self._plan.setdefault(drone, (None, 0))
+            self._outdated = True
+        if self._outdated:
+            self.replan()
+        source, _ = self._plan[drone]
+        if source is None or source.payload <= 0:
+            self._assign(drone)
+            source, _ = self._plan[drone]
+        return source
+
+    def on_load_complete(self, drone):
+        """ Дрон закончил погрузку: следующий источник, если в трюме осталось место, иначе None """
+        if drone not in self._plan:
+            return self.target(drone)
+        self._assign(drone)
+        return self._plan[drone][0]
+
+    def release(self, drone):
+        """ Дрон больше не собирает (погиб, стал воевать): его источник освобождается для остальных """
+        if self._plan.pop(drone, None) is not None:
+            self._outdated = True
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Геометрия на массивах NumPy: каждая функция принимает сразу все точки-кандидаты и возвращает массив,
+вместо того чтобы в цикле создавать Point/Vector и считать по одной точке.
+
+Точки можно передавать как массив формы (n, 2), список пар (x, y), список Point или объектов игры (берется coord).
+"""
+import math
+
+import numpy as np
+from robogame_engine.theme import theme
+
+
+def as_point(point):
+    """ Одна точка (Point, объект игры или пара (x, y)) в виде массива формы (2,) """
+    coord = getattr(point, 'coord', point)
+    if hasattr(coord, 'x'):
+        return np.array((coord.x, coord.y), dtype=float)
+    return np.asarray(coord, dtype=float).reshape(2)
+
+
+def as_points(points):
+    """ Точки в виде массива формы (n, 2) """
+    if isinstance(points, np.ndarray):
+        return points.astype(float, copy=False).reshape(-1, 2)
+    return np.array([as_point(point) for point in points], dtype=float).reshape(-1, 2)
+
+
+def field_size():
+    return theme.FIELD_WIDTH, theme.FIELD_HEIGHT
+
+
+def distances(origin, points):
+    """ Расстояния от точки origin до каждой из points, форма (n,) """
+    delta = as_points(points) - as_point(origin)
+    return np.sqrt((delta ** 2).sum(axis=1))
+
+
+def distance_matrix(points, others):
+    """ Попарные расстояния, форма (len(points), len(others)) """
+    delta = as_points(points)[:, None, :] - as_points(others)[None, :, :]
+    return np.sqrt((delta ** 2).sum(axis=2))
+
+
+def segment_parameters(start, end, points):
+    """
+    Положение проекций точек на прямую start -> end: 0 - проекция в start, 1 - в end.
+    Для вырожденного отрезка (start == end) проекция всех точек - start (параметр 0)
+    """
+    start, end = as_point(start), as_point(end)
+    direction = end - start
+    length_squared = direction @ direction
+    if length_squared == 0:
+        return np.zeros(len(as_points(points)))
+    return (as_points(points) - start) @ direction / length_squared
+
+
+def project_on_line(start, end, points):
+    """ Основания перпендикуляров из точек на прямую start -> end, форма (n, 2) """
+    start, end = as_point(start), as_point(end)
+    return start + segment_parameters(start, end, points)[:, None] * (end - start)
+
+
+def distances_to_segment(start, end, points):
+    """ Расстояния от точек до отрезка start - end (до ближайшей точки отрезка), форма (n,) """
+    start, end = as_point(start), as_point(end)
+    points = as_points(points)
+    parameters = np.clip(segment_parameters(start, end, points), 0, 1)
+    nearest = start + parameters[:, None] * (end - start)
+    return np.sqrt(((points - nearest) ** 2).sum(axis=1))
+
+
+def segment_hits_circles(start, end, centers, radii):
+    """ Какие окружности (centers, radii - число или массив) пересекает отрезок start - end, массив bool """
+    return distances_to_segment(start, end, centers) < radii
+
+
+def segment_circle_intersections(start, end, centers, radii):
+    """
+    Пересечения прямой start -> end с окружностями: параметры входа и выхода (как в segment_parameters),
+    массивы формы (n,), NaN - прямая окружность не пересекает. Пересечение с отрезком - параметры от 0 до 1.
+    """
+    start, end = as_point(start), as_point(end)
+    centers = as_points(centers)
+    direction = end - start
+    a = direction @ direction
+    offset = start - centers
+    b = 2 * offset @ direction
+    c = (offset ** 2).sum(axis=1) - np.asarray(radii, dtype=float) ** 2
+    if a == 0:
+        nan = np.full(len(centers), np.nan)
+        return nan, nan.copy()
+    discriminant = b ** 2 - 4 * a * c
+    with np.errstate(invalid='ignore'):
+        root = np.where(discriminant >= 0, np.sqrt(discriminant), np.nan)
+    return (-b - root) / (2 * a), (-b + root) / (2 * a)
+
+
+def ring_points(center, radius, count, facing=None, arc=2 * math.pi):
+    """
+    count точек на окружности с центром center, форма (count, 2).
+    Для полной окружности точки идут через равные углы, для дуги arc (в радианах) - от края до края дуги.
+    Середина дуги (или первая точка окружности) смотрит на точку facing, без нее - вдоль оси x.
+    """
+    center = as_point(center)
+    base_angle = 0.0
+    if facing is not None:
+        direction = as_point(facing) - center
+        base_angle = math.atan2(direction[1], direction[0])
+    if arc >= 2 * math.pi:
+        angles = base_angle + np.arange(count) * (2 * math.pi / count)
+    else:
+        angles = base_angle + np.linspace(-arc / 2, arc / 2, count)
+    return center + radius * np.column_stack((np.cos(angles), np.sin(angles)))
+
+
+def inside_field(points, margin=0, size=None):
+    """ Какие точки лежат внутри поля, не ближе margin к краю, массив bool """
+    width, height = size or field_size()
+    points = as_points(points)
+    return ((points > margin) & (points < (width - margin, height - margin))).all(axis=1)
+
+
+def clip_to_field(points, margin=0, size=None):
+    """ Точки, сдвинутые внутрь поля (не ближе margin к краю), форма (n, 2) """
+    width, height = size or field_size()
+    return np.clip(as_points(points), margin, (width - margin, height - margin))
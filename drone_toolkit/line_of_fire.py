@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка линии огня: не заденет ли выстрел своих.
+Линия огня - отрезок от стрелка до цели, препятствие - окружность радиуса radius вокруг союзника
+(обычно радиус дрона плюс радиус снаряда с запасом). Проверка точная, без перебора точек на отрезке,
+и считается сразу для всех союзников (и для всех позиций-кандидатов в safe_firing_position).
+"""
+import math
+
+import numpy as np
+from robogame_engine.geometry import Point
+
+from drone_toolkit import geometry
+
+
+def _blocking(starts, end, obstacles, radius, include_ends):
+    """ Матрица (позиция стрелка x препятствие): задевает ли отрезок позиция -> end препятствие """
+    direction = end - starts
+    length_squared = (direction ** 2).sum(axis=1)
+    offset = obstacles[None, :, :] - starts[:, None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        parameters = np.where(length_squared[:, None] > 0,
+                              (offset * direction[:, None, :]).sum(axis=2) / length_squared[:, None], 0)
+    if include_ends:
+        on_segment = np.ones(parameters.shape, dtype=bool)
+        parameters = np.clip(parameters, 0, 1)
+    else:
+        # только препятствия, проекция которых попадает на отрезок (полоса вдоль линии огня)
+        on_segment = (parameters >= 0) & (parameters <= 1)
+    nearest = starts[:, None, :] + parameters[:, :, None] * direction[:, None, :]
+    distances = np.sqrt(((obstacles[None, :, :] - nearest) ** 2).sum(axis=2))
+    return on_segment & (distances < radius)
+
+
+def blocking_mask(start, end, obstacles, radius, include_ends=True):
+    """
+    Какие препятствия (союзники) лежат на линии огня start -> end, массив bool по obstacles.
+    include_ends=False - не считать препятствия за концами отрезка, только те, чья проекция на него попадает.
+    """
+    obstacles = geometry.as_points(obstacles)
+    if not len(obstacles):
+        return np.zeros(0, dtype=bool)
+    starts = geometry.as_point(start)[None, :]
+    return _blocking(starts, geometry.as_point(end), obstacles, radius, include_ends)[0]
+
+
+def is_line_clear(start, end, obstacles, radius, include_ends=True):
+    """ Можно ли стрелять из start в end, никого из obstacles не задев """
+    return not blocking_mask(start, end, obstacles, radius, include_ends).any()
+
+
+def safe_firing_position(shooter, target, obstacles, radius, distance=None, count=36, margin=0):
+    """
+    Ближайшая к стрелку позиция на окружности вокруг цели, откуда линия огня свободна, или None.
+    distance - радиус окружности (по умолчанию - текущее расстояние от стрелка до цели),
+    count - сколько позиций перебирать, margin - отступ позиций от края поля.
+    """
+    shooter, target = geometry.as_point(shooter), geometry.as_point(target)
+    if distance is None:
+        distance = math.sqrt(((shooter - target) ** 2).sum())
+    candidates = geometry.ring_points(target, distance, count, facing=shooter)
+    candidates = candidates[geometry.inside_field(candidates, margin=margin)]
+    obstacles = geometry.as_points(obstacles)
+    if len(obstacles):
+        candidates = candidates[~_blocking(candidates, target, obstacles, radius, include_ends=True).any(axis=1)]
+    if not len(candidates):
+        return None
+    nearest = candidates[np.argmin(geometry.distances(shooter, candidates))]
+    return Point(float(nearest[0]), float(nearest[1]))
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import itertools
+import math
+
+# поле битвы турниров - 1200 x 1200, ячейка такого размера вмещает несколько астероидов
+DEFAULT_CELL_SIZE = 100
+
+
+def _xy(point):
+    """ Координаты объекта игры, точки (Point) или пары (x, y) """
+    if isinstance(point, tuple):
+        return point
+    coord = getattr(point, 'coord', point)
+    return coord.x, coord.y
+
+
+class SpatialGrid:
+    """
+    Равномерная сетка по полю битвы для поиска ближайших объектов без сортировки всех объектов поля.
+    Ближайшие объекты ищутся по кольцам ячеек вокруг точки, пока найденные не окажутся ближе непросмотренных ячеек,
+    так что запрос смотрит только окрестность точки, а не все объекты.
+    Объекты, которые двигаются, нужно переносить в новые ячейки: move(obj) для одного объекта
+    или sync(objects) для всех сразу - объект переносится, только если сменил ячейку.
+    Расстояния считаются так же, как GameObject.distance_to, а при равных расстояниях раньше идет объект,
+    раньше добавленный в сетку, поэтому результат совпадает с sorted(objects, key=distance_to)[:k].
+    """
+
+    def __init__(self, field_size, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.columns = max(math.ceil(field_size[0] / cell_size), 1)
+        self.rows = max(math.ceil(field_size[1] / cell_size), 1)
+        self._cells = {}
+        # объект -> [ячейка, порядковый номер добавления]
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, obj):
+        return obj in self._entries
+
+    def _cell(self, x, y):
+        # объекты за краем поля попадают в крайние ячейки
+        column = min(max(int(x // self.cell_size), 0), self.columns - 1)
+        row = min(max(int(y // self.cell_size), 0), self.rows - 1)
+        return column, row
+
+    def add(self, obj):
+        if obj in self._entries:
+            self.move(obj)
+            return
+        cell = self._cell(*_xy(obj))
+        self._entries[obj] = [cell, next(self._counter)]
+        self._cells.setdefault(cell, []).append(obj)
+
+    def remove(self, obj):
+        entry = self._entries.pop(obj, None)
+        if entry is not None:
+            self._cells[entry[0]].remove(obj)
+
+    def move(self, obj):
+        """ Переносит объект в ячейку по его текущим координатам """
+        entry = self._entries[obj]
+        cell = self._cell(*_xy(obj))
+        if cell != entry[0]:
+            self._cells[entry[0]].remove(obj)
+            self._cells.setdefault(cell, []).append(obj)
+            entry[0] = cell
+
+    def sync(self, objects):
+        """ Приводит сетку к списку objects: новые объекты добавляет, пропавшие убирает, сдвинувшиеся переносит """
+        objects = list(objects)
+        entries = self._entries
+        present = set(objects)
+        if len(present) != len(entries) or not present.issuperset(entries):
+            for obj in [obj for obj in entries if obj not in present]:
+                self.remove(obj)
+        cell_size, last_column, last_row = self.cell_size, self.columns - 1, self.rows - 1
+        for obj in objects:
+            entry = entries.get(obj)
+            if entry is None:
+                self.add(obj)
+                continue
+            x, y = _xy(obj)
+            cell = min(max(int(x // cell_size), 0), last_column), min(max(int(y // cell_size), 0), last_row)
+            if cell != entry[0]:
+                self._cells[entry[0]].remove(obj)
+                self._cells.setdefault(cell, []).append(obj)
+                entry[0] = cell
+
+    def _candidates(self, cells, x, y, kind, predicate, max_distance):
+        found = []
+        for cell in cells:
+            for obj in self._cells.get(cell, ()):
+                if kind is not None and not isinstance(obj, kind):
+                    continue
+                if predicate is not None and not predicate(obj):
+                    continue
+                obj_x, obj_y = _xy(obj)
+                distance = math.sqrt((x - obj_x) ** 2 + (y - obj_y) ** 2)
+                if max_distance is None or distance <= max_distance:
+                    found.append((distance, self._entries[obj][1], obj))
+        return found
+
+    def _ring(self, column, row, radius):
+        """ Ячейки на расстоянии radius ячеек (по Чебышеву) от ячейки (column, row), в пределах сетки """
+        if radius == 0:
+            return [(column, row)]
+        cells = []
+        for cell_column in range(max(column - radius, 0), min(column + radius, self.columns - 1) + 1):
+            for cell_row in (row - radius, row + radius):
+                if 0 <= cell_row < self.rows:
+                    cells.append((cell_column, cell_row))
+        for cell_row in range(max(row - radius + 1, 0), min(row + radius - 1, self.rows - 1) + 1):
+            for cell_column in (column - radius, column + radius):
+                if 0 <= cell_column < self.columns:
+                    cells.append((cell_column, cell_row))
+        return cells
+
+    def _covered_distance(self, x, y, column, row, radius):
+        """ Ближе этого расстояния от точки нет непросмотренных ячеек (после колец до radius включительно) """
+        distances = []
+        if column - radius > 0:
+            distances.append(x - (column - radius) * self.cell_size)
+        if column + radius < self.columns - 1:
+            distances.append((column + radius + 1) * self.cell_size - x)
+        if row - radius > 0:
+            distances.append(y - (row - radius) * self.cell_size)
+        if row + radius < self.rows - 1:
+            distances.append((row + radius + 1) * self.cell_size - y)
+        return max(min(distances), 0) if distances else math.inf
+
+    def nearest(self, point, k=1, kind=None, predicate=None, max_distance=None):
+        """
+        До k ближайших к point объектов, по возрастанию расстояния.
+        kind - класс (или кортеж классов) объектов, predicate - дополнительное условие,
+        например lambda asteroid: asteroid.payload > 0. max_distance - не дальше этого расстояния.
+        """
+        x, y = _xy(point)
+        column, row = self._cell(x, y)
+        found = []
+        radius = 0
+        while True:
+            found.extend(self._candidates(self._ring(column, row, radius), x, y, kind, predicate, max_distance))
+            covered = self._covered_distance(x, y, column, row, radius)
+            if covered == math.inf or (max_distance is not None and covered > max_distance):
+                break
+            if len(found) >= k:
+                found.sort(key=lambda item: item[:2])
+                # объект из непросмотренной ячейки на том же расстоянии мог быть добавлен раньше
+                if found[k - 1][0] < covered:
+                    break
+            radius += 1
+        found.sort(key=lambda item: item[:2])
+        return [obj for _, _, obj in found[:k]]
+
+    def within(self, point, radius, kind=None, predicate=None):
+        """ Объекты не дальше radius от point, по возрастанию расстояния (kind и predicate - как в nearest) """
+        x, y = _xy(point)
+        first_column, first_row = self._cell(x - radius, y - radius)
+        last_column, last_row = self._cell(x + radius, y + radius)
+        cells = itertools.product(range(first_column, last_column + 1), range(first_row, last_row + 1))
+        found = self._candidates(cells, x, y, kind, predicate, radius)
+        found.sort(key=lambda item: item[:2])
+        return [obj for _, _, obj in found]
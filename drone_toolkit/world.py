@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+
+from astrobox.core import Asteroid, Drone, MotherShip
+from robogame_engine.theme import theme
+
+from drone_toolkit.spatial import SpatialGrid
+
+TeamView = namedtuple('TeamView', ('teammates', 'enemies', 'dead_enemies', 'enemy_bases', 'dead_enemy_bases'))
+
+
+class WorldSnapshot:
+    """
+    Состояние поля битвы на один шаг игры, общее для всех дронов всех команд.
+    Строится один раз за шаг (при первом обращении в этом шаге) одним проходом по объектам сцены,
+    дальше списки берутся готовыми из любого обработчика любого дрона:
+
+        world = WorldSnapshot.of(self)
+        for enemy in world.enemies(self.team):
+            ...
+
+    Списки отражают состояние на момент первого обращения в шаге: если дрон погиб или астероид опустел
+    позже в том же шаге, это будет видно только на следующем шаге. Списки общие - менять их нельзя.
+
+    Ближайшие объекты ищутся через сетку (SpatialGrid), одну на всю битву: за шаг в ней переносятся
+    только сдвинувшиеся дроны, а условия вроде непустого астероида проверяются в момент запроса:
+
+        asteroids = world.grid.nearest(self, k=3, kind=Asteroid, predicate=lambda asteroid: asteroid.payload)
+    """
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.step = scene._step
+        # дроны, астероиды и базы в порядке объектов сцены
+        self.units = []
+        self.drones, self.asteroids, self.motherships = [], [], []
+        for obj in scene.objects:
+            if isinstance(obj, Drone):
+                self.drones.append(obj)
+            elif isinstance(obj, Asteroid):
+                self.asteroids.append(obj)
+            elif isinstance(obj, MotherShip):
+                self.motherships.append(obj)
+            else:
+                continue
+            self.units.append(obj)
+        self.alive_drones = [drone for drone in self.drones if drone.is_alive]
+        self.dead_drones = [drone for drone in self.drones if not drone.is_alive]
+        self.alive_motherships = [mothership for mothership in self.motherships if mothership.is_alive]
+        self.non_empty_asteroids = [asteroid for asteroid in self.asteroids if asteroid.payload]
+        # обломки: погибшие дроны и базы, на которых остался элериум
+        self.wrecks = [unit for unit in self.dead_drones if unit.payload]
+        self.wrecks.extend(mothership for mothership in self.motherships
+                           if not mothership.is_alive and mothership.payload)
+        self._teams = {}
+        self._grid = None
+
+    @classmethod
+    def get(cls, scene):
+        """ Снимок сцены на текущий шаг (хранится в самой сцене, поэтому у каждой битвы свой) """
+        snapshot = getattr(scene, '_world_snapshot', None)
+        if snapshot is None or snapshot.step != scene._step:
+            snapshot = scene._world_snapshot = cls(scene)
+        return snapshot
+
+    @classmethod
+    def of(cls, unit):
+        """ Снимок сцены, в которой находится дрон или другой объект игры """
+        return cls.get(unit.scene)
+
+    @property
+    def grid(self):
+        """ Сетка для поиска ближайших дронов, астероидов и баз с координатами на этот шаг """
+        if self._grid is None:
+            grid = getattr(self.scene, '_spatial_grid', None)
+            if grid is None:
+                grid = self.scene._spatial_grid = SpatialGrid((theme.FIELD_WIDTH, theme.FIELD_HEIGHT))
+            grid.sync(self.units)
+            self._grid = grid
+        return self._grid
+
+    def team_view(self, team):
+        """ Списки объектов с точки зрения команды team, считаются один раз за шаг для каждой команды """
+        view = self._teams.get(team)
+        if view is None:
+            view = self._teams[team] = TeamView(
+                teammates=[drone for drone in self.alive_drones if drone.team == team],
+                enemies=[drone for drone in self.alive_drones if drone.team != team],
+                dead_enemies=[drone for drone in self.dead_drones if drone.team != team],
+                enemy_bases=[mothership for mothership in self.alive_motherships if mothership.team != team],
+                dead_enemy_bases=[mothership for mothership in self.motherships
+                                  if mothership.team != team and not mothership.is_alive],
+            )
+        return view
+
+    def teammates(self, team):
+        """ Живые дроны команды """
+        return self.team_view(team).teammates
+
+    def enemies(self, team):
+        """ Живые дроны других команд """
+        return self.team_view(team).enemies
+
+    def dead_enemies(self, team):
+        return self.team_view(team).dead_enemies
+
+    def enemy_bases(self, team):
+        """ Живые базы других команд """
+        return self.team_view(team).enemy_bases
+
+    def dead_enemy_bases(self, team):
+        return self.team_view(team).dead_enemy_bases
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Шаблон процесса для режима fork-server.
+
+Модуль импортируется один раз в процессе-шаблоне (multiprocessing forkserver): загружает движок,
+все модули дронов из ангаров и снимает с них слепки состояния.
+Каждая битва затем выполняется в процессе, форкнутом из шаблона (copy-on-write),
+поэтому на старт битвы не тратится время импорта.
+"""
+import importlib
+import logging
+
+from battle import get_hangar_modules, module_to_import
+from module_state import state_keeper
+
+
+def preload_hangars():
+    for team_module in get_hangar_modules():
+        try:
+            importlib.import_module(module_to_import(team_module))
+        except Exception:
+            logging.exception(f'Не удалось импортировать {team_module}, он будет импортирован в процессе битвы')
+    state_keeper.track_new_modules()
+
+
+preload_hangars()
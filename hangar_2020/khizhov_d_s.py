@@ -1,6 +1,7 @@
 from random import choice, randint, shuffle
 
-from astrobox.core import Drone
+from astrobox.core import Asteroid, Drone
+from drone_toolkit import WorldSnapshot
 from robogame_engine import scene
 from robogame_engine.geometry import Vector, Point
 
@@ -29,7 +30,7 @@ class KhizhovDrone(Drone):
     first_coord = None
     optimal_coord = None
     enemy_target = None
-    all_object = set()
+    all_object = {}  # словарь вместо множества: обходится в порядке добавления, одинаково в каждом запуске
     near_aster = []
     target_move_to = None
     shot_count = 0
@@ -86,8 +87,7 @@ class KhizhovDrone(Drone):
         self.my_team.append(self)
         self.update_all_data()
         max_id = len(self.scene.drones) // self.scene.teams_count
-        near_aster = sorted(self.asteroids, key=lambda asteroid: self.distance_to(asteroid))
-        near_aster = near_aster[:7]
+        near_aster = WorldSnapshot.of(self).grid.nearest(self, k=7, kind=Asteroid)
         vec = Vector.from_direction(self.direction, 250)
         self.first_coord = Point(x=int(self.x + vec.x), y=int(self.y + vec.y))
         coord_1 = [[-100, -100], [100, 100], [-250, -250], [250, 250], [-400, -400], [400, 400]]
@@ -169,7 +169,7 @@ class KhizhovDrone(Drone):
         else:
             dead_drone = [drone for drone in self.scene.drones if
                           not drone.is_alive and drone.distance_to(drone.my_mothership) > 250]
-        self.all_object.update(self.asteroids, dead_drone)
+        self.all_object.update(dict.fromkeys(self.asteroids + dead_drone))
         self.near_aster = sorted(self.all_object, key=lambda asteroid: self.distance_to(asteroid))
         self.near_aster = self.near_aster[:3]
         self.asteroids_in_work = [asteroid for asteroid in self.asteroids if asteroid.payload > 0]
@@ -3,6 +3,7 @@
 import hangar_2021.garin_m_s_package.geom as g
 from astrobox.guns import PlasmaProjectile
 from astrobox.core import Drone, MotherShip
+from drone_toolkit import line_of_fire
 from robogame_engine.geometry import Point
 
 
@@ -230,11 +231,9 @@ def point_on_shot_line(point_start, point_end, point_find, obj_type='drone'):
 def team_on_shot_line(obj, target):
     team = [obj.mothership]
     team.extend(get_team_drones(obj=obj))
-    for drone in team:
-        if point_on_shot_line(point_start=obj.coord, point_end=target, point_find=drone.coord):
-            return True
-    else:
-        return False
+    # то же, что point_on_shot_line для каждого союзника, но сразу для всех
+    return not line_of_fire.is_line_clear(start=obj.coord, end=get_coord(obj=target), obstacles=team,
+                                          radius=DRONE_SAFE_RADIUS, include_ends=False)
 
 
 def get_danger_info(obj, point, count=2):
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+from drone_toolkit import geometry
+
 
 def point_between_points(point_start, point_end, point_find):
     """
@@ -150,9 +152,7 @@ def intersection(point_start, point_end, point_find):
     :param point_find: точка на плоскости.
     :return: координаты близжащей точки от point_find на прямой между двумя point_start и point_end.
     """
-    line = line_on_a_plane(point_1=point_start, point_2=point_end)
-    perpendicular = line_on_a_plane_perpendicular(point=point_find, line=line)
-    return intersection_line_line(line_1=line, line_2=perpendicular)
+    return tuple(geometry.project_on_line(start=point_start, end=point_end, points=[point_find])[0])
 
 
 def points_on_ring(scene, radius, point_base, center, count, edge=0):
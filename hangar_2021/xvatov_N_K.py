@@ -3,6 +3,7 @@ from math import cos, sin
 
 
 from astrobox.core import Drone
+from drone_toolkit import line_of_fire
 import logging
 from robogame_engine.geometry import Point
 from robogame_engine.theme import theme
@@ -345,42 +346,9 @@ class Brain:
         return is_valide
 
     def probe(self, person, point: Point):
-        N=15
-        x0 = point.x
-        x1 = person.coord.x
-        y0 = point.y
-        y1 = person.coord.y
-        k = (y0-y1)/(x0-x1)
-        b = y1-k*x1
-        x_min = min(x0, x1)
-        x_max = max(x0,x1)
-        y_min=min(y1,y1)
-        y_max=max(y0, y1)
-        dx = int((x_max - x_min) // N)
-
-        if dx == 0:
-            dy= int((y_max - y_min)//N)
-            if dy==0:
-                return True
-            y = list(range(int(y_min), int(y_max) + dy, dy))[:N + 1]
-            for i in range(N+1):
-                for partner in self.army:
-                    if not partner.is_alive or partner is person:
-                        continue
-                    elif partner.distance_to(Point(x=x0, y=y[i])) < 60:
-                        return False
-            return True
-        else:
-            x = list(range(int(x_min), int(x_max)+dx, dx))[:N+1]
-            for i in range(N+1):
-                y = k*x[i] + b
-                for partner in self.army:
-                    if not partner.is_alive or partner is person:
-                        continue
-                    elif partner.distance_to(Point(x=x[i], y=y)) < 60:
-                        return False
-            return True
-
+        """ Свободна ли линия огня от person до point: ни одного живого партнера ближе 60 к линии """
+        partners = [partner for partner in self.army if partner.is_alive and partner is not person]
+        return line_of_fire.is_line_clear(start=person.coord, end=point, obstacles=partners, radius=60)
 
     def calculation_min_len(self, person):
         '''Находим ближайший астеройд'''
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+import ast
+import hashlib
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import settings
+
+HANGAR_PREFIX = 'hangar_'
+# общие инструменты команд - от них тоже зависит результат битвы
+TOOLKIT_PACKAGE = 'drone_toolkit'
+INDEX_VERSION = 2
+
+ModuleInfo = namedtuple('ModuleInfo', ('path', 'drone_class', 'source_hash', 'import_time', 'error'))
+
+
+def module_to_import(team_module):
+    return team_module.replace('.py', '').replace('/', '.').replace('\\', '.')
+
+
+def _module_path(dotted_name):
+    base = os.path.join(settings.PROJECT_PATH, *dotted_name.split('.'))
+    for path in (f'{base}.py', os.path.join(base, '__init__.py')):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _imported_modules(path, dotted_name):
+    """ Модули ангаров и drone_toolkit, которые импортирует модуль (абсолютным или относительным импортом) """
+    with open(path, 'rb') as ff:
+        tree = ast.parse(ff.read())
+    package = dotted_name if path.endswith('__init__.py') else dotted_name.rpartition('.')[0]
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                parts = package.split('.')
+                base = '.'.join(parts[:len(parts) - node.level + 1])
+                module = f'{base}.{node.module}' if node.module else base
+            else:
+                module = node.module or ''
+            names.append(module)
+            # from package import module
+            names.extend(f'{module}.{alias.name}' for alias in node.names)
+    return [name for name in names if name.startswith((HANGAR_PREFIX, TOOLKIT_PACKAGE))]
+
+
+def module_sources(team_module):
+    """
+    Исходники модуля команды вместе со всеми модулями ангаров и drone_toolkit, которые он импортирует
+    (например hangar_2020/kachanov_v_a.py вместе с пакетом kachanov_v_a_package): полный путь -> sha256
+    """
+    to_visit = [module_to_import(team_module)]
+    sources = {}
+    while to_visit:
+        dotted_name = to_visit.pop()
+        path = _module_path(dotted_name)
+        if path is None or path in sources:
+            continue
+        with open(path, 'rb') as ff:
+            sources[path] = hashlib.sha256(ff.read()).hexdigest()
+        try:
+            to_visit.extend(_imported_modules(path, dotted_name))
+        except (SyntaxError, ValueError):
+            # сломанный модуль тоже хешируется, ошибку покажет импорт
+            continue
+    return sources
+
+
+def _sources_hash(sources):
+    digest = hashlib.sha256()
+    for path in sorted(sources):
+        digest.update(f'{os.path.relpath(path, settings.PROJECT_PATH)}:{sources[path]}\n'.encode())
+    return digest.hexdigest()
+
+
+def module_source_hash(team_module):
+    """ Хеш исходников модуля команды вместе со всеми модулями ангаров, которые он импортирует """
+    return _sources_hash(module_sources(team_module))
+
+
+def _preload_engine():
+    importlib.import_module('astrobox.core')
+
+
+def inspect_module(team_module):
+    """ Импортирует модуль команды и проверяет drone_class. Возвращает (модуль, класс дронов, время импорта, ошибка) """
+    started_at = time.perf_counter()
+    try:
+        drone_module = importlib.import_module(module_to_import(team_module))
+    except BaseException as exc:
+        return team_module, None, time.perf_counter() - started_at, f'{type(exc).__name__}: {exc}'
+    import_time = time.perf_counter() - started_at
+    drone_class = getattr(drone_module, 'drone_class', None)
+    if drone_class is None:
+        return team_module, None, import_time, 'No variable drone_class'
+    return team_module, getattr(drone_class, '__name__', str(drone_class)), import_time, None
+
+
+def _mtimes(paths):
+    try:
+        return {os.path.relpath(path, settings.PROJECT_PATH): os.stat(path).st_mtime_ns for path in paths}
+    except OSError:
+        return None
+
+
+class HangarIndex:
+    """
+    Индекс модулей команд из ангаров, сохраняемый на диск (settings.HANGAR_INDEX_FILE):
+    для каждого модуля hangar_XXXX/module_name.py - имя класса дронов (drone_class), хеш исходников
+    вместе с пакетами, которые он импортирует, время импорта и ошибка импорта.
+    Запись о модуле устаревает, когда меняется время изменения любого из его файлов,
+    список модулей ангара - когда меняется время изменения директории ангара.
+    Модули вне ангаров (например some_dir/team.py) в списки не попадают, но проверяются и запускаются так же.
+    Модули проверяются импортом в отдельных процессах, чтобы не засорять текущий процесс и не падать вместе с ними.
+    """
+
+    def __init__(self, path=None, workers=None):
+        self.path = path or settings.HANGAR_INDEX_FILE
+        self.workers = workers
+        self._changed = False
+        self._data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as ff:
+                data = json.load(ff)
+            if data.get('version') == INDEX_VERSION:
+                return data
+        except (OSError, ValueError):
+            pass
+        return dict(version=INDEX_VERSION, hangars={}, modules={})
+
+    def save(self):
+        if not self._changed:
+            return
+        tmp_path = f'{self.path}.tmp{os.getpid()}'
+        with open(tmp_path, 'w') as ff:
+            json.dump(self._data, ff, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self._changed = False
+
+    def hangars(self):
+        """
+        Директории ангаров в проекте.
+        Корень проекта просматривается каждый раз (это одна директория): время его изменения для проверки
+        не годится, оно меняется от любого файла в корне, в том числе от самого индекса и журнала базы.
+        """
+        hangars = sorted(entry.name for entry in os.scandir(settings.PROJECT_PATH)
+                         if 'hangar' in entry.name and entry.is_dir())
+        if hangars != list(self._data['hangars']):
+            self._data['hangars'] = {hangar: self._data['hangars'].get(hangar, {}) for hangar in hangars}
+            self._changed = True
+        return hangars
+
+    def modules(self, hangar=None):
+        """ Модули команд в формате hangar_XXXX/module_name.py (всех ангаров или одного) """
+        modules = []
+        for hangar_name in self.hangars():
+            if hangar is not None and hangar_name != hangar:
+                continue
+            hangar_path = os.path.join(settings.PROJECT_PATH, hangar_name)
+            state = self._data['hangars'][hangar_name]
+            mtime_ns = os.stat(hangar_path).st_mtime_ns
+            if state.get('mtime_ns') != mtime_ns:
+                state['mtime_ns'] = mtime_ns
+                state['modules'] = [f'{hangar_name}/{name}' for name in sorted(os.listdir(hangar_path))
+                                    if name.endswith('.py') and '__' not in name]
+                self._changed = True
+            modules.extend(state['modules'])
+        return modules
+
+    def exists(self, team_module):
+        """ Есть ли такой модуль: модули ангаров ищутся в индексе, любые другие пути - на диске """
+        hangar = os.path.dirname(os.path.normpath(team_module))
+        if hangar in self.hangars():
+            if os.path.normpath(team_module).replace(os.sep, '/') in self.modules(hangar=hangar):
+                return True
+        return os.path.exists(os.path.join(settings.PROJECT_PATH, team_module))
+
+    def _entry(self, team_module):
+        """ Актуальная запись о модуле (без проверки импортом), None - модуля нет """
+        entry = self._data['modules'].get(team_module)
+        if entry is not None:
+            files = [os.path.join(settings.PROJECT_PATH, file) for file in entry['files']]
+            if _mtimes(files) == entry['files']:
+                return entry
+        path = os.path.join(settings.PROJECT_PATH, team_module)
+        if not os.path.isfile(path):
+            self._data['modules'].pop(team_module, None)
+            self._changed = True
+            return None
+        sources = module_sources(team_module)
+        files = _mtimes(sources)
+        if files is None:
+            return None
+        entry = self._data['modules'][team_module] = dict(
+            files=files, source_hash=_sources_hash(sources), inspected=False,
+            drone_class=None, import_time=None, error=None,
+        )
+        self._changed = True
+        return entry
+
+    def source_hash(self, team_module):
+        entry = self._entry(team_module)
+        return entry['source_hash'] if entry else None
+
+    def validate(self, team_modules=None):
+        """
+        Проверяет импортом модули команд (по умолчанию - все), для которых нет актуальной проверки,
+        и сохраняет индекс. Возвращает словарь модуль -> ModuleInfo
+        """
+        team_modules = self.modules() if team_modules is None else list(team_modules)
+        entries = {team_module: self._entry(team_module) for team_module in team_modules}
+        to_inspect = [team_module for team_module, entry in entries.items() if entry and not entry['inspected']]
+        if to_inspect:
+            logging.info(f'Проверка модулей команд: {len(to_inspect)}')
+            workers = min(self.workers or os.cpu_count(), len(to_inspect))
+            # spawn - чтобы модули импортировались заново, а не достались от уже импортировавшего их процесса
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_preload_engine) as executor:
+                for team_module, drone_class, import_time, error in executor.map(inspect_module, to_inspect):
+                    entries[team_module].update(inspected=True, drone_class=drone_class,
+                                                import_time=import_time, error=error)
+            self._changed = True
+        self.save()
+        infos = {}
+        for team_module, entry in entries.items():
+            if entry is None:
+                infos[team_module] = ModuleInfo(team_module, None, None, None, 'No such module')
+            else:
+                infos[team_module] = ModuleInfo(team_module, entry['drone_class'], entry['source_hash'],
+                                                entry['import_time'], entry['error'])
+        return infos
+
+    def valid_modules(self, team_modules=None):
+        """ Модули команд, которые импортируются и объявляют drone_class, остальные пропускаются с предупреждением """
+        valid = []
+        for team_module, info in self.validate(team_modules).items():
+            if info.error:
+                logging.warning(f'Модуль {team_module} пропущен: {info.error}')
+            else:
+                valid.append(team_module)
+        return valid
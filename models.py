@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 import datetime
+import json
+import logging
+import zlib
 
 from peewee import (
-    CharField, DatabaseProxy, DateTimeField, IntegerField, Model, TextField,
+    BigIntegerField, BlobField, BooleanField, Case, CharField, DatabaseProxy, DateField, DateTimeField,
+    ForeignKeyField, IntegerField, Model, TextField, chunked, fn,
 )
 from playhouse.db_url import connect
+from playhouse.migrate import SchemaMigrator, migrate
 
 import settings
 
@@ -25,20 +30,193 @@ class BaseModel(Model):
 
 class Player(BaseModel):
     name = CharField(max_length=255)
-    rating = IntegerField(default=settings.INITIAL_RATING)
-    path = CharField(max_length=255)
+    rating = IntegerField(default=settings.INITIAL_RATING, index=True)
+    path = CharField(max_length=255, index=True)
+
+    class Meta:
+        indexes = (
+            (('name', 'path'), True),
+        )
 
 
 class Battle(BaseModel):
     """ для хранения данных об обработанных результатах битв """
-    uuid = CharField(max_length=255)
-    happened_at = DateTimeField()
-    result = TextField()
+    uuid = CharField(max_length=255, unique=True)
+    happened_at = DateTimeField(index=True)
+    game_steps = IntegerField(null=True)
+    # исходный json результата битвы: result - в старых базах, result_blob - сжатый zlib
+    result = TextField(null=True)
+    result_blob = BlobField(null=True)
+
+    def get_result(self):
+        if self.result_blob is not None:
+            return json.loads(zlib.decompress(self.result_blob))
+        if self.result is not None:
+            return json.loads(self.result)
+        return None
+
+
+class BattleParticipant(BaseModel):
+    """ участие игрока в битве: сколько собрал, сколько потерял дронов, место и рейтинг до и после """
+    battle = ForeignKeyField(Battle, backref='participants', on_delete='CASCADE')
+    player = ForeignKeyField(Player, backref='participations')
+    elerium = IntegerField()
+    dead = IntegerField(null=True)
+    rank = IntegerField()
+    rating_before = IntegerField(null=True)
+    rating_after = IntegerField(null=True)
+    # команда снята с битвы за превышение бюджета процессорного времени (--cpu-budget)
+    forfeited = BooleanField(default=False)
+
+
+class RatingCheckpoint(BaseModel):
+    """ рейтинги всех игроков сразу после битвы battle, чтобы пересчет рейтинга не начинать с начала истории """
+    battle = ForeignKeyField(Battle, unique=True, on_delete='CASCADE')
+    # json: id игрока -> рейтинг
+    ratings = TextField()
+
+
+class IngestMark(BaseModel):
+    """ до какого времени изменения (st_mtime_ns) файлы результатов в директории уже загружены """
+    directory = CharField(max_length=1024, unique=True)
+    mtime_ns = BigIntegerField(default=0)
+
+
+class ReportState(BaseModel):
+    """ что уже записано в файл отчета, чтобы дописывать только новое """
+    path = CharField(max_length=1024, unique=True)
+    rendered_on = DateField(null=True)
+    # время изменения файла после записи: если файл менялся не нами, он перезаписывается целиком
+    mtime_ns = BigIntegerField(default=0)
+    last_battle_id = IntegerField(default=0)
+    last_happened_at = DateTimeField(null=True)
+    content = TextField(null=True)
+
+
+def pack_result(battle_result):
+    """ Сжатый json результата битвы, если результаты нужно хранить (settings.STORE_BATTLE_RESULTS) """
+    if not settings.STORE_BATTLE_RESULTS:
+        return None
+    return zlib.compress(json.dumps(battle_result).encode())
+
+
+def rated_elerium():
+    """ Элериум участника, по которому считается рейтинг: снятой с битвы команде засчитывается 0 """
+    return Case(None, [(BattleParticipant.forfeited, 0)], BattleParticipant.elerium)
+
+
+def make_participant_rows(battle_id, battle_result, player_ids, ratings=None):
+    """
+    Строки BattleParticipant для битвы, места - по убыванию собранного элериума, снятые с битвы команды - последние.
+    player_ids - словарь имя команды -> id игрока, ratings - имя команды -> (рейтинг до, рейтинг после)
+    """
+    forfeited = set(battle_result.get('forfeited') or ())
+    collected = list(battle_result['collected'].items())
+    collected.sort(key=lambda x: (x[0] in forfeited, -x[1]))
+    dead = battle_result.get('dead') or {}
+    ratings = ratings or {}
+    rows = []
+    for rank, (name, elerium) in enumerate(collected, start=1):
+        rating_before, rating_after = ratings.get(name, (None, None))
+        rows.append(dict(
+            battle=battle_id,
+            player=player_ids[name],
+            elerium=elerium,
+            dead=dead.get(name),
+            rank=rank,
+            rating_before=rating_before,
+            rating_after=rating_after,
+            forfeited=name in forfeited,
+        ))
+    return rows
+
+
+def _drop_duplicates(database, model, fields):
+    """ Удаляет дубли по fields (оставляя самую раннюю запись), если уникального индекса по ним еще нет """
+    table_name = model._meta.table_name
+    if not database.table_exists(table_name):
+        return
+    column_names = [field.column_name for field in fields]
+    for index in database.get_indexes(table_name):
+        if index.unique and index.columns == column_names:
+            return
+    first_ids = model.select(fn.MIN(model.id)).group_by(*fields)
+    deleted = model.delete().where(model.id.not_in(first_ids)).execute()
+    if deleted:
+        logging.warning(f'Из таблицы {table_name} удалено {deleted} дублей по {column_names}')
+
+
+def _add_battle_columns(database):
+    """ Добавляет в старую таблицу battle колонки game_steps и result_blob, result делает необязательным """
+    if not database.table_exists(Battle._meta.table_name):
+        return
+    columns = {column.name: column for column in database.get_columns(Battle._meta.table_name)}
+    migrator = SchemaMigrator.from_database(database)
+    operations = []
+    for field in (Battle.game_steps, Battle.result_blob):
+        if field.column_name not in columns:
+            operations.append(migrator.add_column(Battle._meta.table_name, field.column_name, field))
+    if not columns[Battle.result.column_name].null:
+        operations.append(migrator.drop_not_null(Battle._meta.table_name, Battle.result.column_name))
+    if operations:
+        with database.atomic():
+            migrate(*operations)
+
+
+def _add_participant_columns(database):
+    """ Добавляет в старую таблицу участников колонку forfeited """
+    table_name = BattleParticipant._meta.table_name
+    if not database.table_exists(table_name):
+        return
+    columns = {column.name for column in database.get_columns(table_name)}
+    if BattleParticipant.forfeited.column_name not in columns:
+        migrator = SchemaMigrator.from_database(database)
+        with database.atomic():
+            migrate(migrator.add_column(table_name, BattleParticipant.forfeited.column_name,
+                                        BattleParticipant.forfeited))
+
+
+def _fill_participants(database):
+    """ Разбирает json старых битв один раз: заполняет game_steps, участников и сжимает результат """
+    old_battle_ids = [battle_id for battle_id, in Battle.select(Battle.id).where(
+        Battle.game_steps.is_null() & Battle.result.is_null(False)).tuples()]
+    if not old_battle_ids:
+        return
+    logging.warning(f'Перенос результатов {len(old_battle_ids)} битв в таблицу участников')
+    players = {(player.name, player.path): player for player in Player.select()}
+    for batch_ids in chunked(old_battle_ids, 500):
+        with database.atomic():
+            for battle in Battle.select().where(Battle.id.in_(batch_ids)):
+                battle_result = battle.get_result()
+                player_ids = {}
+                for name in battle_result['collected']:
+                    key = (name, battle_result['players_modules'][name])
+                    if key not in players:
+                        players[key] = Player.create(name=name, path=key[1])
+                    player_ids[name] = players[key].id
+                BattleParticipant.insert_many(make_participant_rows(battle.id, battle_result, player_ids)).execute()
+                Battle.update(
+                    game_steps=battle_result.get('game_steps'), result=None, result_blob=pack_result(battle_result),
+                ).where(Battle.id == battle.id).execute()
+
+
+def migrate_db(database):
+    """
+    Легкая миграция схемы: create_tables создает недостающие таблицы и индексы (IF NOT EXISTS),
+    перед созданием уникальных индексов в старых базах удаляются дубли,
+    а json-результаты старых битв раскладываются по колонкам и таблице участников.
+    """
+    _drop_duplicates(database, Player, [Player.name, Player.path])
+    _drop_duplicates(database, Battle, [Battle.uuid])
+    _add_battle_columns(database)
+    _add_participant_columns(database)
+    database.create_tables([Player, Battle, BattleParticipant, RatingCheckpoint, IngestMark, ReportState])
+    _fill_participants(database)
 
 
 def init_db(db_url):
     database = connect(db_url)
     db_proxy.initialize(database)
-    database.create_tables([Player, Battle])
+    migrate_db(database)
     return database
 
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import ast
+import copy
+import enum
+import inspect
+import logging
+import sys
+import types
+
+from robogame_engine import GameObject
+
+HANGAR_PREFIX = 'hangar_'
+# служебные атрибуты классов, которые не являются состоянием
+SERVICE_ATTRS = ('_abc_impl', )
+
+
+def _is_state(value):
+    """ Значения, которые считаются состоянием: все, кроме кода, модулей и классов """
+    if isinstance(value, (types.ModuleType, type, types.BuiltinFunctionType)):
+        return False
+    # функции, методы, свойства и прочие дескрипторы
+    return not hasattr(type(value), '__get__')
+
+
+def _assigned_names(module):
+    """
+    Имена, которым присваивается значение в теле модуля.
+    Импортированные объекты (например theme движка) состоянием модуля не считаются.
+    """
+    try:
+        tree = ast.parse(inspect.getsource(module))
+    except (OSError, TypeError, SyntaxError):
+        return set()
+    names = set()
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets = list(node.targets)
+        elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+            targets = [node.target]
+        else:
+            continue
+        while targets:
+            target = targets.pop()
+            if isinstance(target, ast.Name):
+                names.add(target.id)
+            elif isinstance(target, (ast.Tuple, ast.List)):
+                targets.extend(target.elts)
+            elif isinstance(target, ast.Starred):
+                targets.append(target.value)
+    return names
+
+
+class NamespaceSnapshot:
+    """ Слепок атрибутов-состояний одного пространства имен (модуля или класса) """
+
+    def __init__(self, namespace, name, memo, state_names=None):
+        self.namespace = namespace
+        self.name = name
+        self.names = set(self._own_names())
+        self.values = {}
+        for attr_name in self.names:
+            if state_names is not None and attr_name not in state_names:
+                continue
+            value = self._own_dict()[attr_name]
+            if attr_name in SERVICE_ATTRS or not _is_state(value):
+                continue
+            try:
+                self.values[attr_name] = copy.deepcopy(value, memo)
+            except Exception:
+                logging.warning(f'Не удалось сохранить {name}.{attr_name}, состояние не будет восстанавливаться')
+
+    def _own_dict(self):
+        return vars(self.namespace)
+
+    def _own_names(self):
+        return [name for name in self._own_dict() if not (name.startswith('__') and name.endswith('__'))]
+
+    def restore(self, memo):
+        own_dict = self._own_dict()
+        for attr_name in set(self._own_names()) - self.names:
+            # подмодули пакета, импортированные позже, состоянием не являются
+            if _is_state(own_dict[attr_name]):
+                delattr(self.namespace, attr_name)
+        for attr_name, value in self.values.items():
+            setattr(self.namespace, attr_name, copy.deepcopy(value, memo))
+
+
+class ModuleSnapshot:
+    """ Слепок состояния модуля и всех объявленных в нем классов (включая вложенные) """
+
+    def __init__(self, module, memo):
+        self.module = module
+        self.namespaces = [NamespaceSnapshot(module, module.__name__, memo, state_names=_assigned_names(module))]
+        for cls in self._module_classes(module):
+            self.namespaces.append(NamespaceSnapshot(cls, f'{module.__name__}.{cls.__qualname__}', memo))
+
+    @staticmethod
+    def _module_classes(module):
+        classes = []
+        to_visit = [value for value in vars(module).values() if inspect.isclass(value)]
+        while to_visit:
+            cls = to_visit.pop()
+            if cls.__module__ != module.__name__ or cls in classes or issubclass(cls, enum.Enum):
+                continue
+            classes.append(cls)
+            to_visit.extend(value for value in vars(cls).values() if inspect.isclass(value))
+        return classes
+
+    def restore(self, memo):
+        for namespace in self.namespaces:
+            namespace.restore(memo)
+
+
+class BattleStateKeeper:
+    """
+    Позволяет проводить много битв в одном процессе.
+    Модули дронов импортируются один раз, сразу после импорта с них снимается слепок,
+    а перед каждой следующей битвой состояние модулей и их классов восстанавливается из слепка.
+    Модули, импортированные дронами прямо во время битвы, попадут в слепок перед следующей битвой.
+    """
+
+    def __init__(self, prefix=HANGAR_PREFIX):
+        self.prefix = prefix
+        self.snapshots = {}
+        # общий memo для deepcopy, чтобы объекты, разделяемые между модулями и классами
+        # (например список, импортированный из соседнего модуля), и после восстановления остались общими
+        self._memo = {}
+
+    def track_new_modules(self):
+        for name, module in list(sys.modules.items()):
+            if name in self.snapshots or not name.startswith(self.prefix) or module is None:
+                continue
+            self.snapshots[name] = ModuleSnapshot(module, self._memo)
+
+    def restore(self):
+        memo = {}
+        for snapshot in self.snapshots.values():
+            snapshot.restore(memo)
+        reset_engine_state()
+
+
+def reset_engine_state():
+    """ Сбрасывает глобальное состояние движка, накопленное предыдущей битвой """
+    GameObject._GameObject__objects_count = 0
+
+
+state_keeper = BattleStateKeeper()
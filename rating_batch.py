@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import math
+
+import numpy as np
+
+import settings
+
+GLICKO2_SCALE = 400 / math.log(10)
+GLICKO2_INITIAL_DEVIATION = 350
+GLICKO2_INITIAL_VOLATILITY = 0.06
+GLICKO2_TAU = 0.5
+GLICKO2_EPSILON = 0.000001
+
+
+def elo_coefficients(ratings):
+    """ K-фактор Elo для массива рейтингов по settings.ELO_COEFFICIENTS (первый подходящий порог) """
+    coefficients = np.full(ratings.shape, 40.0)
+    assigned = np.zeros(ratings.shape, dtype=bool)
+    for rating_bond, coeff in settings.ELO_COEFFICIENTS:
+        matched = (ratings >= rating_bond) & ~assigned
+        coefficients[matched] = coeff
+        assigned |= matched
+    return coefficients
+
+
+def pair_results(scores, mask):
+    """
+    Результаты партий внутри битв (битвы x участник x соперник): 1, 0.5 или 0, как в elo_changes.
+    Возвращает результаты и маску настоящих пар (без пустых мест и партий с самим собой).
+    """
+    player_scores, opponent_scores = scores[:, :, None], scores[:, None, :]
+    avg = (player_scores + opponent_scores) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(avg != 0, np.abs(player_scores - opponent_scores) / avg, 0)
+    results = np.where(delta < .05, .5, np.where(player_scores > opponent_scores, 1., 0.))
+    pair_mask = mask[:, :, None] & mask[:, None, :] & ~np.eye(scores.shape[1], dtype=bool)
+    return results, pair_mask
+
+
+def make_waves(players, breaks=()):
+    """
+    Делит битвы на волны - подряд идущие битвы без общих игроков.
+    Битвы одной волны не влияют друг на друга, поэтому их можно считать одновременно.
+    После битв из breaks волна обязательно заканчивается (например чтобы снять слепок рейтингов).
+    """
+    waves = []
+    start, wave_players = 0, set()
+    for battle_index, battle_players in enumerate(players.tolist()):
+        battle_players = {player for player in battle_players if player >= 0}
+        if wave_players & battle_players:
+            waves.append((start, battle_index))
+            start, wave_players = battle_index, set()
+        wave_players |= battle_players
+        if battle_index in breaks:
+            waves.append((start, battle_index + 1))
+            start, wave_players = battle_index + 1, set()
+    if start < len(players):
+        waves.append((start, len(players)))
+    return waves
+
+
+def replay_elo(players, scores, ratings, snapshot_after=()):
+    """
+    Пересчитывает Elo по битвам в порядке истории, результат совпадает с elo_changes для каждой битвы.
+    players - матрица битвы x участники с индексами игроков в ratings (-1 - пустое место),
+    scores - такая же матрица собранного элериума, ratings - рейтинги всех игроков (меняются на месте).
+    Возвращает рейтинги участников до и после каждой битвы
+    и слепки всех рейтингов после битв с индексами из snapshot_after.
+    """
+    players = np.asarray(players, dtype=np.int64)
+    scores = np.asarray(scores, dtype=float)
+    mask = players >= 0
+    player_indexes = np.where(mask, players, 0)
+    results, pair_mask = pair_results(scores, mask)
+    snapshot_after = set(snapshot_after)
+    ratings_before = np.zeros(players.shape, dtype=np.int64)
+    ratings_after = np.zeros(players.shape, dtype=np.int64)
+    snapshots = {}
+    for start, stop in make_waves(players, breaks=snapshot_after):
+        wave_mask = mask[start:stop]
+        wave_players = player_indexes[start:stop]
+        wave_ratings = ratings[wave_players]
+        expectation = 1 / (1 + 10 ** ((wave_ratings[:, None, :] - wave_ratings[:, :, None]) / 400))
+        rating_changes = np.trunc(elo_coefficients(wave_ratings)[:, :, None] * (results[start:stop] - expectation))
+        rating_changes = np.where(pair_mask[start:stop], rating_changes, 0).sum(axis=2).astype(np.int64)
+        ratings_before[start:stop] = wave_ratings
+        ratings_after[start:stop] = wave_ratings + rating_changes
+        ratings[wave_players[wave_mask]] = ratings_after[start:stop][wave_mask]
+        if stop - 1 in snapshot_after:
+            snapshots[stop - 1] = ratings.copy()
+    return ratings_before, ratings_after, snapshots
+
+
+def _glicko2_volatility_equation(x, delta, phi, v, volatility):
+    a = np.log(volatility ** 2)
+    ex = np.exp(x)
+    return ex * (delta ** 2 - phi ** 2 - v - ex) / (2 * (phi ** 2 + v + ex) ** 2) - (x - a) / GLICKO2_TAU ** 2
+
+
+def _glicko2_volatility(delta, phi, v, volatility):
+    """ Новая волатильность (шаг 5 алгоритма Glicko-2, метод Иллинойса), для всех участников сразу """
+    a = np.log(volatility ** 2)
+    big_delta = delta ** 2 > phi ** 2 + v
+    with np.errstate(invalid='ignore'):
+        lower = np.where(big_delta, np.log(np.where(big_delta, delta ** 2 - phi ** 2 - v, 1)), a)
+    k = np.ones(a.shape)
+    search = ~big_delta & (_glicko2_volatility_equation(a - k * GLICKO2_TAU, delta, phi, v, volatility) < 0)
+    while search.any():
+        k[search] += 1
+        search &= _glicko2_volatility_equation(a - k * GLICKO2_TAU, delta, phi, v, volatility) < 0
+    lower = np.where(big_delta, lower, a - k * GLICKO2_TAU)
+    upper, f_upper = a, _glicko2_volatility_equation(a, delta, phi, v, volatility)
+    f_lower = _glicko2_volatility_equation(lower, delta, phi, v, volatility)
+    active = np.abs(lower - upper) > GLICKO2_EPSILON
+    while active.any():
+        middle = upper + (upper - lower) * f_upper / (f_lower - f_upper)
+        f_middle = _glicko2_volatility_equation(middle, delta, phi, v, volatility)
+        swap = f_middle * f_lower <= 0
+        upper = np.where(active & swap, lower, upper)
+        f_upper = np.where(active & swap, f_lower, np.where(active, f_upper / 2, f_upper))
+        lower = np.where(active, middle, lower)
+        f_lower = np.where(active, f_middle, f_lower)
+        active &= np.abs(lower - upper) > GLICKO2_EPSILON
+    return np.exp(upper / 2)
+
+
+def replay_glicko2(players, scores, ratings, deviations, volatilities):
+    """
+    Рейтинг Glicko-2 по битвам в порядке истории: каждая битва - отдельный рейтинговый период для ее участников,
+    в котором каждый участник сыграл партию с каждым соперником (результаты партий - как в Elo).
+    Матрицы players и scores - как в replay_elo, ratings, deviations и volatilities - массивы по всем игрокам
+    (меняются на месте). Шкала рейтинга та же, что у Elo, с центром в settings.INITIAL_RATING.
+    """
+    players = np.asarray(players, dtype=np.int64)
+    scores = np.asarray(scores, dtype=float)
+    mask = players >= 0
+    player_indexes = np.where(mask, players, 0)
+    results, pair_mask = pair_results(scores, mask)
+    for start, stop in make_waves(players):
+        wave_players = player_indexes[start:stop]
+        wave_pairs = pair_mask[start:stop]
+        # участники без соперников в рейтинговом периоде не меняются
+        played = wave_pairs.any(axis=2) & mask[start:stop]
+        mu = (ratings[wave_players] - settings.INITIAL_RATING) / GLICKO2_SCALE
+        phi = deviations[wave_players] / GLICKO2_SCALE
+        volatility = volatilities[wave_players]
+        g = 1 / np.sqrt(1 + 3 * phi ** 2 / math.pi ** 2)
+        expectation = 1 / (1 + np.exp(-g[:, None, :] * (mu[:, :, None] - mu[:, None, :])))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v = 1 / np.where(wave_pairs, g[:, None, :] ** 2 * expectation * (1 - expectation), 0).sum(axis=2)
+        improvement = np.where(wave_pairs, g[:, None, :] * (results[start:stop] - expectation), 0).sum(axis=2)
+        # у не игравших v = inf, поэтому маска - до умножения, иначе inf * 0
+        v = np.where(played, v, 1)
+        delta = np.where(played, v * improvement, 0)
+        new_volatility = _glicko2_volatility(delta, phi, v, volatility)
+        new_phi = 1 / np.sqrt(1 / (phi ** 2 + new_volatility ** 2) + 1 / v)
+        new_mu = mu + new_phi ** 2 * improvement
+        updated = wave_players[played]
+        ratings[updated] = (new_mu * GLICKO2_SCALE + settings.INITIAL_RATING)[played]
+        deviations[updated] = (new_phi * GLICKO2_SCALE)[played]
+        volatilities[updated] = new_volatility[played]
+    return ratings, deviations, volatilities
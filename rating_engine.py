@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+import itertools
+import json
+import logging
+
+import numpy as np
+from peewee import chunked
+
+from models import Battle, BattleParticipant, Player, RatingCheckpoint, rated_elerium
+from rating_batch import GLICKO2_INITIAL_DEVIATION, GLICKO2_INITIAL_VOLATILITY, replay_elo, replay_glicko2
+import settings
+
+BULK_BATCH_SIZE = 500
+
+
+def elo_coefficient(rating):
+    for rating_bond, coeff in settings.ELO_COEFFICIENTS:
+        if rating >= rating_bond:
+            return coeff
+    return 40
+
+
+def elo_changes(player_scores, ratings):
+    """
+    Изменения рейтинга игроков по результатам одной битвы.
+    Все изменения считаются от рейтингов до битвы (ratings), поэтому не зависят от порядка команд в player_scores.
+    """
+    verbose = logging.getLogger().isEnabledFor(logging.INFO)
+    changes = {}
+    for name, player_elerium in player_scores.items():
+        koef_elo = elo_coefficient(ratings[name])
+        changes[name] = 0
+        for opponent_name, opponent_elerium in player_scores.items():
+            if opponent_name == name:
+                continue
+            expectation = 1 / (1 + 10 ** ((ratings[opponent_name] - ratings[name]) / 400))
+            avg = (player_elerium + opponent_elerium) / 2
+            delta = abs(player_elerium - opponent_elerium) / avg if avg else 0
+            if delta < .05:
+                battle_result = 0.5
+            elif player_elerium > opponent_elerium:
+                battle_result = 1
+            else:
+                battle_result = 0
+            rating_change = int(koef_elo * (battle_result - expectation))
+            if verbose:
+                logging.info(f'Рассчет Ело: {name}/{ratings[name]} vs {opponent_name}/{ratings[opponent_name]}')
+                logging.info(f'\tЭлериум: {name}: {player_elerium}, {opponent_name}: {opponent_elerium}')
+                logging.info(f'\texpectation {expectation}')
+                logging.info(f'\tdelta elerium {delta} battle_result {battle_result} rating_change {rating_change}')
+            changes[name] += rating_change
+    return changes
+
+
+def _not_before(happened_at, battle_uuid, inclusive=True):
+    """ Условие на битвы, которые в истории рейтинга идут после битвы (happened_at, battle_uuid) """
+    same_time = Battle.uuid >= battle_uuid if inclusive else Battle.uuid > battle_uuid
+    return (Battle.happened_at > happened_at) | ((Battle.happened_at == happened_at) & same_time)
+
+
+class RatingEngine:
+    """
+    Рейтинг как функция истории битв.
+    Битвы упорядочены по (happened_at, uuid), а не по порядку загрузки результатов.
+    Изменения рейтинга в битве считаются от рейтингов участников до нее, у каждого участника битвы
+    хранится рейтинг до и после, а раз в checkpoint_interval битв сохраняются рейтинги всех игроков.
+    Поэтому при добавлении или удалении битвы из прошлого пересчитывается только история после нее.
+    """
+
+    def __init__(self, database, checkpoint_interval=settings.RATING_CHECKPOINT_INTERVAL):
+        self.database = database
+        self.checkpoint_interval = checkpoint_interval
+        # объекты с методом update_ratings({id игрока: рейтинг}), например rating_index.RatingIndex
+        self.listeners = []
+
+    def _notify(self, ratings):
+        for listener in self.listeners:
+            listener.update_ratings(ratings)
+
+    def _state_before(self, happened_at, battle_uuid):
+        """ Рейтинги игроков перед битвой и сколько битв прошло с последней контрольной точки """
+        checkpoint = RatingCheckpoint.select(RatingCheckpoint, Battle).join(Battle).where(
+            ~_not_before(happened_at, battle_uuid)
+        ).order_by(Battle.happened_at.desc(), Battle.uuid.desc()).first()
+        replayed = ~_not_before(happened_at, battle_uuid)
+        ratings = {}
+        if checkpoint is not None:
+            ratings = {int(player_id): rating for player_id, rating in json.loads(checkpoint.ratings).items()}
+            replayed &= _not_before(checkpoint.battle.happened_at, checkpoint.battle.uuid, inclusive=False)
+        participants = BattleParticipant.select(
+            BattleParticipant.battle, BattleParticipant.player, BattleParticipant.rating_after,
+        ).join(Battle).where(replayed).order_by(Battle.happened_at, Battle.uuid).tuples()
+        battle_ids = set()
+        for battle_id, player_id, rating_after in participants.iterator():
+            ratings[player_id] = rating_after
+            battle_ids.add(battle_id)
+        return ratings, len(battle_ids)
+
+    def _drop_checkpoints(self, happened_at, battle_uuid):
+        stale = RatingCheckpoint.select(RatingCheckpoint.id).join(Battle).where(
+            _not_before(happened_at, battle_uuid))
+        RatingCheckpoint.delete().where(RatingCheckpoint.id.in_(stale)).execute()
+
+    def _participants(self, where=None):
+        participants = BattleParticipant.select(
+            BattleParticipant.id, BattleParticipant.battle, BattleParticipant.player, BattleParticipant.elerium,
+            BattleParticipant.forfeited, BattleParticipant.rating_before, BattleParticipant.rating_after,
+            Player.id, Player.name, Player.rating,
+        ).join(Battle).switch(BattleParticipant).join(Player)
+        return participants if where is None else participants.where(where)
+
+    def _rate_battle(self, participants, ratings):
+        """ Проставляет участникам битвы рейтинги до и после нее, возвращает измененных участников """
+        ratings_before = {participant.player.name: ratings.get(participant.player.id, settings.INITIAL_RATING)
+                          for participant in participants}
+        changes = elo_changes(
+            player_scores={participant.player.name: 0 if participant.forfeited else participant.elerium
+                           for participant in participants},
+            ratings=ratings_before,
+        )
+        changed = []
+        for participant in participants:
+            name = participant.player.name
+            rating_after = ratings_before[name] + changes[name]
+            ratings[participant.player.id] = rating_after
+            if (participant.rating_before, participant.rating_after) != (ratings_before[name], rating_after):
+                participant.rating_before, participant.rating_after = ratings_before[name], rating_after
+                changed.append(participant)
+        return changed
+
+    @staticmethod
+    def _history_matrices(participants, player_indexes):
+        """
+        Участники битв в виде матриц битвы x участники для rating_batch: индексы игроков, собранный элериум
+        и id участников. Возвращает еще id битв и сохраненные рейтинги участников до и после битв.
+        """
+        battles = [list(battle_participants) for _, battle_participants in itertools.groupby(
+            participants, key=lambda participant: participant[1])]
+        shape = (len(battles), max((len(battle_participants) for battle_participants in battles), default=0))
+        players = np.full(shape, -1, dtype=np.int64)
+        scores = np.zeros(shape)
+        participant_ids = np.zeros(shape, dtype=np.int64)
+        battle_ids, stored_ratings = [], {}
+        for battle_index, battle_participants in enumerate(battles):
+            battle_ids.append(battle_participants[0][1])
+            for place, (participant_id, _, player_id, elerium, rating_before, rating_after) in enumerate(
+                    battle_participants):
+                players[battle_index, place] = player_indexes[player_id]
+                scores[battle_index, place] = elerium
+                participant_ids[battle_index, place] = participant_id
+                stored_ratings[participant_id] = (rating_before, rating_after)
+        return battle_ids, players, scores, participant_ids, stored_ratings
+
+    def recompute_from(self, happened_at=None, battle_uuid=None):
+        """
+        Пересчитывает рейтинг начиная с битвы (happened_at, battle_uuid), без аргументов - всю историю.
+        Вся пересчитываемая история загружается в матрицы и считается векторно (rating_batch.replay_elo).
+        """
+        with self.database.atomic():
+            participants = BattleParticipant.select(
+                BattleParticipant.id, BattleParticipant.battle, BattleParticipant.player, rated_elerium(),
+                BattleParticipant.rating_before, BattleParticipant.rating_after,
+            ).join(Battle)
+            if happened_at is None:
+                RatingCheckpoint.delete().execute()
+                state, since_checkpoint = {}, 0
+            else:
+                self._drop_checkpoints(happened_at, battle_uuid)
+                state, since_checkpoint = self._state_before(happened_at, battle_uuid)
+                participants = participants.where(_not_before(happened_at, battle_uuid))
+            participants = participants.order_by(Battle.happened_at, Battle.uuid, BattleParticipant.rank).tuples()
+
+            current_ratings = dict(Player.select(Player.id, Player.rating).tuples())
+            player_ids = list(current_ratings)
+            player_indexes = {player_id: index for index, player_id in enumerate(player_ids)}
+            ratings = np.array([state.get(player_id, settings.INITIAL_RATING) for player_id in player_ids],
+                               dtype=np.int64)
+            battle_ids, players, scores, participant_ids, stored_ratings = self._history_matrices(
+                participants.iterator(), player_indexes)
+            first_checkpoint = max(self.checkpoint_interval - since_checkpoint - 1, 0)
+            ratings_before, ratings_after, snapshots = replay_elo(
+                players, scores, ratings,
+                snapshot_after=range(first_checkpoint, len(battle_ids), self.checkpoint_interval),
+            )
+
+            mask = players >= 0
+            changed_participants = []
+            for participant_id, rating_before, rating_after in zip(
+                    participant_ids[mask].tolist(), ratings_before[mask].tolist(), ratings_after[mask].tolist()):
+                if stored_ratings[participant_id] != (rating_before, rating_after):
+                    changed_participants.append(BattleParticipant(
+                        id=participant_id, rating_before=rating_before, rating_after=rating_after))
+            if changed_participants:
+                BattleParticipant.bulk_update(changed_participants,
+                                              fields=[BattleParticipant.rating_before, BattleParticipant.rating_after],
+                                              batch_size=BULK_BATCH_SIZE)
+            checkpoints = [
+                dict(battle=battle_ids[battle_index], ratings=json.dumps(dict(zip(player_ids, snapshot.tolist()))))
+                for battle_index, snapshot in snapshots.items()
+            ]
+            for batch in chunked(checkpoints, BULK_BATCH_SIZE):
+                RatingCheckpoint.insert_many(batch).execute()
+            changed_players = [
+                Player(id=player_id, rating=rating)
+                for player_id, rating in zip(player_ids, ratings.tolist()) if current_ratings[player_id] != rating
+            ]
+            if changed_players:
+                Player.bulk_update(changed_players, fields=[Player.rating], batch_size=BULK_BATCH_SIZE)
+        logging.info(f'Рейтинг пересчитан по {len(battle_ids)} битвам, изменился у {len(changed_players)} игроков')
+        self._notify(dict(zip(player_ids, ratings.tolist())))
+        return len(battle_ids)
+
+    def glicko2_ratings(self):
+        """
+        Рейтинг Glicko-2 по всей истории битв (в БД не сохраняется).
+        Возвращает словарь id игрока -> (рейтинг, отклонение рейтинга)
+        """
+        participants = BattleParticipant.select(
+            BattleParticipant.id, BattleParticipant.battle, BattleParticipant.player, rated_elerium(),
+            BattleParticipant.rating_before, BattleParticipant.rating_after,
+        ).join(Battle).order_by(Battle.happened_at, Battle.uuid, BattleParticipant.rank).tuples()
+        player_ids = [player_id for player_id, in Player.select(Player.id).tuples()]
+        player_indexes = {player_id: index for index, player_id in enumerate(player_ids)}
+        _, players, scores, _, _ = self._history_matrices(participants.iterator(), player_indexes)
+        ratings, deviations, _ = replay_glicko2(
+            players, scores,
+            ratings=np.full(len(player_ids), float(settings.INITIAL_RATING)),
+            deviations=np.full(len(player_ids), float(GLICKO2_INITIAL_DEVIATION)),
+            volatilities=np.full(len(player_ids), GLICKO2_INITIAL_VOLATILITY),
+        )
+        return {player_id: (float(ratings[index]), float(deviations[index]))
+                for player_id, index in player_indexes.items()}
+
+    def apply_battle(self, battle):
+        """
+        Учитывает в рейтинге новую битву, участники которой уже записаны в БД.
+        Если это не последняя битва в истории - пересчитывает историю после нее.
+        """
+        if Battle.select().where(_not_before(battle.happened_at, battle.uuid, inclusive=False)).exists():
+            return self.recompute_from(battle.happened_at, battle.uuid)
+        with self.database.atomic():
+            participants = list(self._participants(BattleParticipant.battle == battle.id))
+            ratings = {participant.player.id: participant.player.rating for participant in participants}
+            for participant in self._rate_battle(participants, ratings):
+                participant.save(only=[BattleParticipant.rating_before, BattleParticipant.rating_after,
+                                       BattleParticipant.updated_at])
+            for participant in participants:
+                participant.player.rating = ratings[participant.player.id]
+                participant.player.save(only=[Player.rating, Player.updated_at])
+            self._checkpoint_if_needed(battle)
+        self._notify({participant.player.id: participant.player.rating for participant in participants})
+        return 1
+
+    def _checkpoint_if_needed(self, battle):
+        battles = Battle.select()
+        checkpoint = RatingCheckpoint.select(RatingCheckpoint, Battle).join(Battle).order_by(
+            Battle.happened_at.desc(), Battle.uuid.desc()).first()
+        if checkpoint is not None:
+            battles = battles.where(_not_before(checkpoint.battle.happened_at, checkpoint.battle.uuid, inclusive=False))
+        if battles.count() >= self.checkpoint_interval:
+            ratings = {player_id: rating for player_id, rating in Player.select(Player.id, Player.rating).tuples()}
+            RatingCheckpoint.create(battle=battle.id, ratings=json.dumps(ratings))
+
+    def remove_battle(self, battle_uuid):
+        """ Удаляет битву из истории и пересчитывает рейтинг после нее """
+        battle = Battle.get_or_none(Battle.uuid == battle_uuid)
+        if battle is None:
+            return False
+        with self.database.atomic():
+            self._drop_checkpoints(battle.happened_at, battle.uuid)
+            BattleParticipant.delete().where(BattleParticipant.battle == battle.id).execute()
+            battle.delete_instance()
+            self.recompute_from(battle.happened_at, battle.uuid)
+        return True
+
+    def check_history(self):
+        """ Досчитывает рейтинг для битв, у участников которых его еще нет (например после миграции старой БД) """
+        first_unrated = Battle.select(Battle.happened_at, Battle.uuid).join(BattleParticipant).where(
+            BattleParticipant.rating_after.is_null()
+        ).order_by(Battle.happened_at, Battle.uuid).first()
+        if first_unrated is not None:
+            logging.warning(f'Пересчет рейтинга начиная с битвы {first_unrated.uuid}')
+            self.recompute_from(first_unrated.happened_at, first_unrated.uuid)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import bisect
+from collections import namedtuple
+
+from models import Player
+
+IndexedPlayer = namedtuple('IndexedPlayer', ('id', 'path', 'rating'))
+
+
+class RatingIndex:
+    """
+    Игроки, отсортированные по рейтингу (а при равном рейтинге - по id), для подбора соперников без запросов к БД.
+    Границы полос рейтинга ищутся бинарным поиском.
+    Чтобы индекс не отставал от БД, его можно подписать на изменения рейтинга: rating_engine.listeners.append(index)
+    """
+
+    def __init__(self, players=()):
+        self._players = {player.id: player for player in players}
+        self._ids_by_path = {}
+        self._rebuild()
+
+    @classmethod
+    def load(cls):
+        return cls(IndexedPlayer(*row) for row in Player.select(Player.id, Player.path, Player.rating).tuples())
+
+    def __len__(self):
+        return len(self._players)
+
+    def _rebuild(self):
+        self._sorted = sorted(self._players.values(), key=lambda player: (player.rating, player.id))
+        self._ratings = [player.rating for player in self._sorted]
+        self._ids_by_path = {}
+        for player in sorted(self._players.values(), key=lambda player: player.id):
+            self._ids_by_path.setdefault(player.path, player.id)
+
+    def _position(self, player):
+        """ Место игрока в отсортированном списке: бинарный поиск по рейтингу, среди равных - по id """
+        position = bisect.bisect_left(self._ratings, player.rating)
+        while (position < len(self._sorted) and self._ratings[position] == player.rating
+               and self._sorted[position].id < player.id):
+            position += 1
+        return position
+
+    def update_ratings(self, ratings):
+        """ Новые рейтинги игроков: словарь id игрока -> рейтинг """
+        unknown_ids = {player_id for player_id in ratings if player_id not in self._players}
+        if unknown_ids:
+            new_players = Player.select(Player.id, Player.path).where(Player.id.in_(list(unknown_ids)))
+            for player_id, path in new_players.tuples():
+                self._players[player_id] = IndexedPlayer(player_id, path, ratings[player_id])
+        if len(ratings) > len(self._players) // 8:
+            for player_id, rating in ratings.items():
+                if player_id in self._players:
+                    self._players[player_id] = self._players[player_id]._replace(rating=rating)
+            self._rebuild()
+            return
+        for player_id, rating in ratings.items():
+            player = self._players.get(player_id)
+            if player is None:
+                continue
+            if player_id not in unknown_ids:
+                position = self._position(player)
+                del self._sorted[position]
+                del self._ratings[position]
+            player = self._players[player_id] = player._replace(rating=rating)
+            position = self._position(player)
+            self._sorted.insert(position, player)
+            self._ratings.insert(position, rating)
+            self._ids_by_path.setdefault(player.path, player_id)
+
+    def get_by_path(self, path):
+        player_id = self._ids_by_path.get(path)
+        return self._players[player_id] if player_id is not None else None
+
+    def above(self, rating, limit):
+        """ limit игроков с рейтингом больше rating, по возрастанию рейтинга """
+        start = bisect.bisect_right(self._ratings, rating)
+        return self._sorted[start:start + limit]
+
+    def below(self, rating, limit):
+        """ limit игроков с рейтингом меньше rating, по убыванию рейтинга """
+        stop = bisect.bisect_left(self._ratings, rating)
+        return self._sorted[max(stop - limit, 0):stop][::-1]
+
+    def between(self, low, high):
+        """ Игроки с рейтингом от low до high включительно, по возрастанию рейтинга """
+        return self._sorted[bisect.bisect_left(self._ratings, low):bisect.bisect_right(self._ratings, high)]
@@ -1,18 +1,30 @@
 import argparse
-import datetime
-import json
 import logging
 import os
+import sys
 
-from models import Player, Battle, init_db
+from peewee import chunked
+
+from models import Player, Battle, BattleParticipant, init_db, make_participant_rows, pack_result
+from rating_engine import RatingEngine
+from reports import ReportWriter
+from result_reader import Quarantine, find_result_files, read_results
+from result_watcher import ResultWatcher
 import settings
 
+BULK_BATCH_SIZE = 500
+
 
 class RatingUpdater:
 
-    def __init__(self, db_url, out_file):
+    def __init__(self, db_url, out_file, workers=None):
         self.database = init_db(db_url)
         self.out_file = out_file
+        self.workers = workers
+        self.quarantine = Quarantine()
+        self.reports = ReportWriter()
+        self.rating_engine = RatingEngine(self.database)
+        self.rating_engine.check_history()
 
     def get_players(self, battle_results):
         players = {}
@@ -23,108 +35,124 @@ class RatingUpdater:
             players[name] = player
         return players
 
-    def parse_results(self, results):
-        player_scores = results['collected']
-        players = self.get_players(battle_results=results)
-        for name, player_elerium in player_scores.items():
-            user = players[name]
-            koef_elo = 40
-            for rating_bond, coeff in settings.ELO_COEFFICIENTS:
-                if user.rating >= rating_bond:
-                    koef_elo = coeff
-                    break
-            for opponent_name, opponent_elerium in player_scores.items():
-                if opponent_name == name:
-                    continue
-                opponent = players[opponent_name]
-                logging.info(f'Рассчет Ело: {name}/{user.rating} vs {opponent_name}/{opponent.rating}')
-                logging.info(f'\tЭлериум: {name}: {player_elerium}, {opponent_name}: {opponent_elerium}')
-                expectation = 1 / (1 + 10 ** ((opponent.rating - user.rating) / 400))
-                logging.info(f'\texpectation {expectation}')
-                avg = (player_elerium + opponent_elerium) / 2
-                delta = abs(player_elerium - opponent_elerium) / avg if avg else 0
-                if delta < .05:
-                    battle_result = 0.5
-                elif player_elerium > opponent_elerium:
-                    battle_result = 1
-                else:
-                    battle_result = 0
-                rating_change = int(koef_elo * (battle_result - expectation))
-                logging.info(f'\tdelta elerium {delta} battle_result {battle_result} rating_change {rating_change}')
-                user.rating += rating_change
-            user.save()
-        return players
-
     def write_results_in_file(self):
-        with open(self.out_file, 'w') as table:
-            table.write(f"##### Рейтинг по состоянию на {datetime.date.today().strftime('%d.%m.%Y')}\n\n")
-            table.write(f"Позиция|Имя команды|Рейтинг\n")
-            table.write(f"---|---|---:\n")
-            players = Player.select().order_by(Player.rating.desc())
-            for index, player in enumerate(players):
-                if index > 41:
-                    break
-                table.write(f"{index + 1}|{player.name}|{player.rating}\n")
+        self.reports.write_rating(self.out_file)
 
     def write_logs_in_file(self, log_file):
-        today = datetime.date.today()
-        date_from = today - datetime.timedelta(days=31)
-        battles = Battle.select().filter(
-            Battle.happened_at >= date_from
-        ).order_by(
-            Battle.happened_at.desc()
-        )
-        rows = [
-            ('Дата сражения', 'Продолжительность (шагов игры)',
-             'Первый результат', 'Второй результат', 'Третий результат', 'Четвертый результат'),
-            ['---', ] * 6,
-        ]
-        for battle in battles:
-            battle_result = json.loads(battle.result)
-            collected = list(battle_result['collected'].items())
-            collected.sort(key=lambda x: -x[1])
-            dead = battle_result.get('dead')
-            cells = [battle.happened_at.strftime('%Y-%m-%d %H:%M:%S'), str(battle_result['game_steps']), ]
-            for student, result in collected:
-                cell = f'{result} - {student}'
-                if dead and dead[student]:
-                    cell += ' /dead/'
-                cells.append(cell)
-            rows.append(cells)
-        with open(log_file, 'w') as table:
-            table.write(f"##### Результаты соревнований с {date_from.strftime('%d.%m.%Y')} "
-                        f"по {today.strftime('%d.%m.%Y')}\n\n")
-            for row in rows:
-                table.write('{}\n'.format(' | '.join(row)))
+        self.reports.write_log(log_file)
+
+    def remove_battle(self, battle_uuid):
+        if not self.rating_engine.remove_battle(battle_uuid):
+            return False
+        self.reports.invalidate()
+        return True
 
     def update_rating(self, battle_results):
+        """ Учитывает битву в рейтинге. Возвращает False, если битва с таким uuid уже была учтена раньше """
         if 'uuid' not in battle_results:
             raise ValueError('Battle results must contain uuid!')
         battle_uuid = battle_results['uuid']
         if Battle.get_or_none(Battle.uuid == battle_uuid):
             # logging.warning(f'Battle {battle_uuid} has been processed before. Skipped.')
-            return
-        self.parse_results(battle_results)
-        Battle.create(
-            uuid=battle_uuid,
-            happened_at=battle_results.get('happened_at'),
-            result=json.dumps(battle_results),
-        )
-
-    def renew_from_files(self, path, files):
-        for file in files:
-            full_file_name = os.path.join(path, file)
-            with open(full_file_name, 'r') as ff:
-                battle_result = json.load(ff)
+            return False
+        with self.database.atomic():
+            players = self.get_players(battle_results)
+            battle = Battle.create(
+                uuid=battle_uuid,
+                happened_at=battle_results.get('happened_at'),
+                game_steps=battle_results.get('game_steps'),
+                result_blob=pack_result(battle_results),
+            )
+            player_ids = {name: player.id for name, player in players.items()}
+            BattleParticipant.insert_many(make_participant_rows(battle.id, battle_results, player_ids)).execute()
+            self.rating_engine.apply_battle(battle)
+        return True
+
+    def renew_from_files(self, file_names):
+        for file_name, battle_result in self._read_new_results(file_names):
             try:
                 self.update_rating(battle_result)
-            except Exception:
-                pass
-                # logging.exception(f'Some error happened while process file {file}. Skipped.')
+            except Exception as exc:
+                self.quarantine.add(file_name, f'{type(exc).__name__}: {exc}')
 
     def renew_from_directory(self, path):
-        for dirpath, dirnames, filenames in os.walk(path):
-            self.renew_from_files(dirpath, filenames)
+        self.renew_from_files(find_result_files(path))
+
+    def _read_new_results(self, file_names):
+        """
+        Читает файлы результатов параллельно (self.workers процессов), ошибки отправляет в карантин.
+        Возвращает еще не обработанные результаты (имя файла, результат) в порядке истории битв - по happened_at и uuid.
+        """
+        read_results_by_uuid = {}
+        for file_name, battle_result, error in read_results(file_names, workers=self.workers):
+            if error:
+                self.quarantine.add(file_name, error)
+                continue
+            read_results_by_uuid.setdefault(battle_result['uuid'], (file_name, battle_result))
+        for batch in chunked(list(read_results_by_uuid), BULK_BATCH_SIZE):
+            for battle_uuid, in Battle.select(Battle.uuid).where(Battle.uuid.in_(batch)).tuples():
+                del read_results_by_uuid[battle_uuid]
+        battle_results = list(read_results_by_uuid.values())
+        battle_results.sort(key=lambda item: (item[1]['happened_at'], item[1]['uuid']))
+        return battle_results
+
+    def bulk_renew_from_directory(self, path):
+        """
+        Массовая загрузка результатов битв из директории.
+        Файлы читаются параллельно, уже обработанные битвы отсеиваются по заранее загруженному множеству uuid,
+        игроки, битвы и их участники записываются в БД пачками в одной транзакции,
+        а рейтинг пересчитывается один раз - начиная с самой ранней из новых битв.
+        Результаты, по которым не удалось подготовить строки для БД, уходят в карантин, как и при загрузке по одному.
+        """
+        battle_results = self._read_new_results(find_result_files(path))
+
+        players = {(player.name, player.path): player for player in Player.select()}
+        new_players = []
+        battle_rows, participant_rows = [], []
+        for file_name, battle_result in battle_results:
+            # строки каждой битвы готовятся отдельно: битва с ошибкой уходит в карантин, а не отменяет всю загрузку
+            try:
+                player_keys = {name: (name, battle_result['players_modules'][name])
+                               for name in battle_result['collected']}
+                # id битвы и игроков известны только после вставки, пока вместо них - uuid и (имя, модуль)
+                rows = make_participant_rows(battle_result['uuid'], battle_result, player_keys)
+                battle_row = dict(
+                    uuid=battle_result['uuid'],
+                    happened_at=battle_result.get('happened_at'),
+                    game_steps=battle_result.get('game_steps'),
+                    result_blob=pack_result(battle_result),
+                )
+            except Exception as exc:
+                self.quarantine.add(file_name, f'{type(exc).__name__}: {exc}')
+                continue
+            for key in player_keys.values():
+                if key not in players:
+                    players[key] = Player(name=key[0], path=key[1])
+                    new_players.append(players[key])
+            battle_rows.append(battle_row)
+            participant_rows.extend(rows)
+        if not battle_rows:
+            return 0
+
+        with self.database.atomic():
+            for batch in chunked(new_players, BULK_BATCH_SIZE):
+                Player.insert_many([player.__data__ for player in batch]).execute()
+            for batch in chunked(battle_rows, BULK_BATCH_SIZE):
+                Battle.insert_many(batch).execute()
+            player_ids = {(player.name, player.path): player.id for player in Player.select(
+                Player.id, Player.name, Player.path)}
+            battle_ids = {}
+            for batch in chunked([battle_row['uuid'] for battle_row in battle_rows], BULK_BATCH_SIZE):
+                battle_ids.update(Battle.select(Battle.uuid, Battle.id).where(Battle.uuid.in_(batch)).tuples())
+            for row in participant_rows:
+                row['battle'], row['player'] = battle_ids[row['battle']], player_ids[row['player']]
+            for batch in chunked(participant_rows, BULK_BATCH_SIZE):
+                BattleParticipant.insert_many(batch).execute()
+            first_battle = Battle.select(Battle.happened_at, Battle.uuid).where(
+                Battle.id.in_(list(battle_ids.values()))
+            ).order_by(Battle.happened_at, Battle.uuid).first()
+            self.rating_engine.recompute_from(first_battle.happened_at, first_battle.uuid)
+        return len(battle_rows)
 
 
 if __name__ == '__main__':
@@ -144,18 +172,53 @@ if __name__ == '__main__':
                              f'(если не указано то {settings.BATTLES_LOG})')
     parser.add_argument('-b', '--database', type=str, default=settings.DB_URL,
                         help=f'URL соединения с БД (если не указано то {settings.DB_URL})')
+    parser.add_argument('-q', '--quarantine-file', type=str, default=settings.QUARANTINE_FILE,
+                        help=f'куда сохранять список файлов, которые не удалось загрузить '
+                             f'(если не указано то {settings.QUARANTINE_FILE})')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='Количество процессов для чтения файлов результатов')
+    parser.add_argument('--watch', type=str,
+                        help='следить за папкой с результатами битв (вместе с подпапками) и сразу загружать новые. '
+                             'На Linux о новых файлах сообщает inotify (пакет inotify_simple из requirements.txt), '
+                             'без него папка опрашивается раз в секунду')
+    parser.add_argument('--report-interval', type=float, default=settings.REPORT_INTERVAL,
+                        help=f'в режиме --watch перезаписывать рейтинг и лог битв не чаще раза в столько секунд '
+                             f'(если не указано то {settings.REPORT_INTERVAL})')
+    parser.add_argument('--bulk', default=False, action='store_true',
+                        help='загружать директорию с результатами пачками (быстрее)')
+    parser.add_argument('--remove-battle', type=str, nargs=argparse.ONE_OR_MORE,
+                        help='uuid битв(ы), которые нужно убрать из истории (рейтинг после них пересчитается)')
+    parser.add_argument('--recompute', default=False, action='store_true',
+                        help='пересчитать рейтинг по всей истории битв')
     parser.add_argument('-v', '--verbose', default=False, action='store_true',
                         help='подробности рассчета рейтинга')
     args = parser.parse_args()
-    if not args.battle_result and not args.battle_result_directory:
+    if not (args.battle_result or args.battle_result_directory or args.remove_battle or args.recompute
+            or args.watch):
         raise ValueError('Нужно указать или файл с результатом битвы или директорию с такими файлами')
     if args.verbose:
         logging.basicConfig(level=logging.INFO)
 
-    astro_rating = RatingUpdater(db_url=args.database, out_file=args.out_file)
+    astro_rating = RatingUpdater(db_url=args.database, out_file=args.out_file, workers=args.workers)
+    for removed_uuid in args.remove_battle or []:
+        if not astro_rating.remove_battle(removed_uuid):
+            logging.warning(f'Битва {removed_uuid} не найдена')
+    if args.recompute:
+        astro_rating.rating_engine.recompute_from()
     if args.battle_result:
-        astro_rating.renew_from_files(*args.battle_result)
+        astro_rating.renew_from_files(args.battle_result)
     if args.battle_result_directory:
-        astro_rating.renew_from_directory(args.battle_result_directory)
+        if args.bulk:
+            astro_rating.bulk_renew_from_directory(args.battle_result_directory)
+        else:
+            astro_rating.renew_from_directory(args.battle_result_directory)
+    if args.watch:
+        watcher = ResultWatcher(updater=astro_rating, path=args.watch, log_file=args.log_file,
+                                quarantine_file=args.quarantine_file, report_interval=args.report_interval)
+        watcher.run()
+        sys.exit(0)
     astro_rating.write_results_in_file()
     astro_rating.write_logs_in_file(log_file=args.log_file)
+    if astro_rating.quarantine:
+        astro_rating.quarantine.write(args.quarantine_file)
+        print(f'Не удалось загрузить {len(astro_rating.quarantine)} файлов, см {args.quarantine_file}')
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import os
+
+from models import Battle, BattleParticipant, Player, ReportState
+
+LEADERBOARD_SIZE = 42
+LOG_DAYS = 31
+LOG_HEADER = (
+    ('Дата сражения', 'Продолжительность (шагов игры)',
+     'Первый результат', 'Второй результат', 'Третий результат', 'Четвертый результат'),
+    ['---', ] * 6,
+)
+
+
+def write_file_atomic(path, text):
+    """ Запись через временный файл, чтобы читатели не видели недописанный файл """
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'w') as ff:
+        ff.write(text)
+    os.replace(tmp_path, path)
+
+
+def _log_rows(participants):
+    rows = []
+    battle_id = None
+    for participant_battle_id, happened_at, game_steps, elerium, dead, forfeited, student in participants:
+        if participant_battle_id != battle_id:
+            battle_id = participant_battle_id
+            # в старых результатах битв game_steps может не быть
+            cells = [happened_at.strftime('%Y-%m-%d %H:%M:%S'), '' if game_steps is None else str(game_steps), ]
+            rows.append(cells)
+        cell = f'{elerium} - {student}'
+        if dead:
+            cell += ' /dead/'
+        if forfeited:
+            cell += ' /forfeit/'
+        cells.append(cell)
+    return ['{}\n'.format(' | '.join(row)) for row in rows]
+
+
+class ReportWriter:
+    """
+    Пишет таблицу рейтинга и лог битв, не переделывая уже сделанную работу.
+    Что записано в каждый файл, хранится в БД (ReportState): таблица рейтинга перезаписывается,
+    только если изменились первые 42 места, а лог битв идет по возрастанию даты, и новые битвы дописываются
+    в конец файла - время записи зависит от числа новых битв, а не от размера лога.
+    Лог пишется целиком заново, если он изменен не нами, наступил новый день (сдвигается окно лога)
+    или новая битва попадает в середину лога.
+    """
+
+    @staticmethod
+    def _get_state(path, today):
+        state, _ = ReportState.get_or_create(path=os.path.abspath(path))
+        try:
+            intact = state.rendered_on == today and os.stat(path).st_mtime_ns == state.mtime_ns
+        except OSError:
+            intact = False
+        return state, intact
+
+    @staticmethod
+    def invalidate():
+        """ Следующая запись перепишет отчеты целиком (например после удаления битвы) """
+        ReportState.delete().execute()
+
+    @staticmethod
+    def _save_state(state, path, today):
+        state.rendered_on = today
+        state.mtime_ns = os.stat(path).st_mtime_ns
+        state.save()
+
+    def write_rating(self, path, today=None):
+        """ Перезаписывает таблицу рейтинга, если она изменилась. Возвращает True, если файл перезаписан """
+        today = today or datetime.date.today()
+        players = list(Player.select(Player.name, Player.rating).order_by(
+            Player.rating.desc()).limit(LEADERBOARD_SIZE).tuples())
+        leaderboard = json.dumps(players)
+        state, intact = self._get_state(path, today)
+        if intact and state.content == leaderboard:
+            return False
+        lines = [
+            f"##### Рейтинг по состоянию на {today.strftime('%d.%m.%Y')}\n\n",
+            f"Позиция|Имя команды|Рейтинг\n",
+            f"---|---|---:\n",
+        ]
+        lines.extend(f"{index + 1}|{name}|{rating}\n" for index, (name, rating) in enumerate(players))
+        write_file_atomic(path, ''.join(lines))
+        state.content = leaderboard
+        self._save_state(state, path, today)
+        return True
+
+    def write_log(self, path, today=None):
+        """ Дописывает новые битвы в конец лога. Возвращает количество записанных битв """
+        today = today or datetime.date.today()
+        date_from = today - datetime.timedelta(days=LOG_DAYS)
+        state, intact = self._get_state(path, today)
+        battles = Battle.select(Battle.id, Battle.happened_at).where(Battle.happened_at >= date_from)
+        if intact:
+            new_battles = battles.where(Battle.id > state.last_battle_id)
+            first_new_battle = new_battles.order_by(Battle.happened_at).first()
+            if first_new_battle is None:
+                return 0
+            # битва из прошлого попадает в середину лога - тогда лог пишется заново
+            intact = state.last_happened_at is None or first_new_battle.happened_at >= state.last_happened_at
+        if not intact:
+            new_battles = battles
+            state.last_battle_id, state.last_happened_at = 0, None
+        participants = list(BattleParticipant.select(
+            Battle.id, Battle.happened_at, Battle.game_steps,
+            BattleParticipant.elerium, BattleParticipant.dead, BattleParticipant.forfeited, Player.name,
+        ).join(Battle).switch(BattleParticipant).join(Player).where(
+            Battle.id.in_(new_battles.select(Battle.id))
+        ).order_by(
+            Battle.happened_at, Battle.id, BattleParticipant.rank
+        ).tuples())
+        new_rows = _log_rows(participants)
+        if intact:
+            # лог идет по возрастанию даты - новые битвы дописываются в конец, старые строки не перечитываются
+            with open(path, 'a') as ff:
+                ff.write(''.join(new_rows))
+        else:
+            lines = [
+                f"##### Результаты соревнований с {date_from.strftime('%d.%m.%Y')} "
+                f"по {today.strftime('%d.%m.%Y')}\n\n",
+            ]
+            lines.extend('{}\n'.format(' | '.join(row)) for row in LOG_HEADER)
+            lines.extend(new_rows)
+            write_file_atomic(path, ''.join(lines))
+        if participants:
+            state.last_battle_id = max(state.last_battle_id, max(participant[0] for participant in participants))
+            # участники отсортированы по возрастанию даты битвы
+            state.last_happened_at = participants[-1][1]
+        self._save_state(state, path, today)
+        return len(new_rows)
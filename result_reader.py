@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+RESULT_FILE_SUFFIX = '.json'
+REQUIRED_KEYS = ('uuid', 'happened_at', 'game_steps', 'collected', 'players_modules')
+CHUNK_SIZE = 256
+
+
+def loads(data):
+    """ Разбор json, через orjson, если он установлен """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def check_battle_result(battle_result):
+    if not isinstance(battle_result, dict):
+        raise ValueError('Battle result must be a json object')
+    missed = [key for key in REQUIRED_KEYS if key not in battle_result]
+    if missed:
+        raise ValueError(f'Battle result must contain {", ".join(missed)}')
+    if not isinstance(battle_result['uuid'], str) or not battle_result['uuid']:
+        raise ValueError('uuid must be a non-empty string')
+    # по happened_at упорядочена история рейтинга, поэтому дата проверяется при чтении, а не при загрузке в БД
+    happened_at = battle_result['happened_at']
+    if not isinstance(happened_at, str):
+        raise ValueError(f'happened_at must be a date string, got {happened_at!r}')
+    datetime.datetime.fromisoformat(happened_at)
+    if battle_result['game_steps'] is not None and not _is_number(battle_result['game_steps']):
+        raise ValueError(f'game_steps must be a number, got {battle_result["game_steps"]!r}')
+    collected, players_modules = battle_result['collected'], battle_result['players_modules']
+    if not isinstance(collected, dict) or not isinstance(players_modules, dict):
+        raise ValueError('collected and players_modules must be json objects')
+    dead = battle_result.get('dead') or {}
+    if not isinstance(dead, dict):
+        raise ValueError('dead must be a json object')
+    for name, elerium in collected.items():
+        if not _is_number(elerium):
+            raise ValueError(f'Elerium of team {name} must be a number, got {elerium!r}')
+        if not isinstance(players_modules.get(name), str):
+            raise ValueError(f'No module for team {name}')
+        if dead.get(name) is not None and not _is_number(dead[name]):
+            raise ValueError(f'Dead drones of team {name} must be a number, got {dead[name]!r}')
+
+
+def read_result(file_name):
+    """ Читает и проверяет один файл результата битвы. Возвращает (имя файла, результат, ошибка) """
+    try:
+        with open(file_name, 'rb') as ff:
+            battle_result = loads(ff.read())
+        check_battle_result(battle_result)
+    except Exception as exc:
+        return file_name, None, f'{type(exc).__name__}: {exc}'
+    return file_name, battle_result, None
+
+
+def find_result_files(path):
+    file_names = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        file_names.extend(os.path.join(dirpath, file) for file in filenames if file.endswith(RESULT_FILE_SUFFIX))
+    return sorted(file_names)
+
+
+def read_results(file_names, workers=None):
+    """
+    Читает файлы результатов битв пулом из workers процессов (по умолчанию - по числу ядер),
+    при workers=1 - в текущем процессе.
+    Порядок результатов совпадает с порядком file_names.
+    """
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(file_names) < CHUNK_SIZE:
+        yield from map(read_result, file_names)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(read_result, file_names, chunksize=CHUNK_SIZE)
+
+
+class Quarantine:
+    """
+    Файлы результатов, которые не удалось загрузить, с причинами - вместо молчаливого пропуска.
+    В памяти держатся только еще не записанные в отчет файлы: первая запись в отчет делается заново,
+    следующие (например в режиме --watch) только дописывают новые строки.
+    """
+
+    def __init__(self):
+        self.files = []
+        self.count = 0
+        self._report_file = None
+
+    def __len__(self):
+        return self.count
+
+    def add(self, file_name, error):
+        logging.warning(f'Файл {file_name} пропущен: {error}')
+        self.files.append((file_name, error))
+        self.count += 1
+
+    def write(self, report_file):
+        appending = self._report_file == report_file
+        with open(report_file, 'a' if appending else 'w') as report:
+            if not appending:
+                report.write(f"##### Необработанные результаты битв на "
+                             f"{datetime.datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n\n")
+                report.write("Файл|Ошибка\n")
+                report.write("---|---\n")
+            for file_name, error in self.files:
+                error = error.replace('|', '\\|').replace('\n', ' ')
+                report.write(f"{file_name}|{error}\n")
+        self._report_file = report_file
+        self.files = []
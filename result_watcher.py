@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = flags = None
+
+from models import IngestMark
+from result_reader import RESULT_FILE_SUFFIX, find_result_files
+
+# файлы, измененные незадолго до отметки, после перезапуска проверяются еще раз
+# (несколько battle.py могут писать результаты одновременно), уже загруженные битвы отсеются по uuid
+MTIME_MARGIN_NS = 60 * 10 ** 9
+# при опросе директории файл берется, только если он не менялся столько секунд
+SETTLE_SECONDS = 1
+
+
+class ResultWatcher:
+    """
+    Следит за директорией с результатами битв (battle.py --out-dir) и сразу загружает новые файлы,
+    как и загрузка директории без --watch (find_result_files) - вместе с поддиректориями.
+    О новых файлах узнает через inotify (inotify_simple, только Linux), иначе - опрашивая директорию.
+    Время изменения загруженных файлов запоминается в БД (IngestMark), поэтому после перезапуска
+    старые файлы не перечитываются. Таблица рейтинга и лог битв перезаписываются не чаще раза в report_interval секунд.
+    """
+
+    def __init__(self, updater, path, log_file, quarantine_file, report_interval=10, poll_interval=1):
+        self.updater = updater
+        self.path = os.path.abspath(path)
+        self.log_file = log_file
+        self.quarantine_file = quarantine_file
+        self.report_interval = report_interval
+        self.poll_interval = poll_interval
+        self.mark, _ = IngestMark.get_or_create(directory=self.path)
+        self._seen = {}
+        # дескриптор inotify -> директория
+        self._watches = {}
+        self._dirty = False
+        self._reported_at = 0
+
+    def _new_files(self, settle=True, path=None):
+        """
+        Файлы результатов в директории path (по умолчанию - в отслеживаемой) и ее поддиректориях
+        новее отметки, которые еще не загружались (имя файла -> время изменения)
+        """
+        threshold = self.mark.mtime_ns - MTIME_MARGIN_NS
+        settled = time.time_ns() - SETTLE_SECONDS * 10 ** 9
+        new_files = {}
+        for file_name in find_result_files(path or self.path):
+            try:
+                mtime_ns = os.stat(file_name).st_mtime_ns
+            except OSError:
+                continue
+            if mtime_ns < threshold or self._seen.get(file_name) == mtime_ns:
+                continue
+            if settle and mtime_ns > settled:
+                continue
+            new_files[file_name] = mtime_ns
+        return new_files
+
+    def ingest(self, new_files):
+        if not new_files:
+            return
+        file_names = sorted(new_files, key=new_files.get)
+        self.updater.renew_from_files(file_names)
+        logging.info(f'Загружено файлов: {len(file_names)}')
+        self._seen.update(new_files)
+        self.mark.mtime_ns = max(self.mark.mtime_ns, max(new_files.values()))
+        self.mark.save()
+        threshold = self.mark.mtime_ns - MTIME_MARGIN_NS
+        self._seen = {file_name: mtime_ns for file_name, mtime_ns in self._seen.items() if mtime_ns >= threshold}
+        self._dirty = True
+
+    def write_reports(self, force=False):
+        if not self._dirty:
+            return
+        if not force and time.monotonic() - self._reported_at < self.report_interval:
+            return
+        self.updater.write_results_in_file()
+        self.updater.write_logs_in_file(log_file=self.log_file)
+        if self.updater.quarantine.files:
+            self.updater.quarantine.write(self.quarantine_file)
+        self._reported_at = time.monotonic()
+        self._dirty = False
+
+    def _add_watches(self, inotify, path):
+        """ Следит за директорией и всеми ее поддиректориями """
+        # CLOSE_WRITE - файл дописан на месте, MOVED_TO - переименован из временного (см battle.save_battle_result),
+        # CREATE - для новых поддиректорий
+        for dirpath, _, _ in os.walk(path):
+            self._watches[inotify.add_watch(dirpath, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE)] = dirpath
+
+    def _inotify_files(self, inotify):
+        new_files = {}
+        for event in inotify.read(timeout=int(self.poll_interval * 1000)):
+            dirpath = self._watches.get(event.wd)
+            if dirpath is None:
+                continue
+            if event.mask & flags.ISDIR:
+                if event.mask & (flags.CREATE | flags.MOVED_TO):
+                    # в новую директорию файлы могли попасть раньше, чем за ней начали следить
+                    subdirectory = os.path.join(dirpath, event.name)
+                    self._add_watches(inotify, subdirectory)
+                    new_files.update(self._new_files(settle=False, path=subdirectory))
+                continue
+            if not event.name.endswith(RESULT_FILE_SUFFIX) or event.mask & flags.CREATE:
+                continue
+            file_name = os.path.join(dirpath, event.name)
+            try:
+                new_files[file_name] = os.stat(file_name).st_mtime_ns
+            except OSError:
+                continue
+        return new_files
+
+    def run(self):
+        inotify = None
+        if INotify is not None:
+            inotify = INotify()
+            self._add_watches(inotify, self.path)
+        else:
+            logging.warning('inotify_simple не установлен, директория будет опрашиваться '
+                            f'каждые {self.poll_interval} с')
+        try:
+            # файлы, появившиеся пока загрузка не работала
+            self.ingest(self._new_files(settle=False))
+            self.write_reports(force=True)
+            while True:
+                if inotify is not None:
+                    self.ingest(self._inotify_files(inotify))
+                else:
+                    time.sleep(self.poll_interval)
+                    self.ingest(self._new_files())
+                self.write_reports()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.write_reports(force=True)
+            if inotify is not None:
+                inotify.close()
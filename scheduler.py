@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+Расписание турниров: круговой турнир, швейцарская система, лесенка и адаптивный подбор.
+
+Планировщики выдают спецификации битв (словари аргументов run_battle) раундами,
+битвы одного раунда не пересекаются по игрокам и могут идти параллельно (battle.run_battles).
+Швейцарская система и лесенка подбирают соперников по текущему рейтингу,
+поэтому между раундами рейтинг обновляется по результатам битв.
+Адаптивный подбор ставит битвы, которые больше всего уточняют рейтинг (по отклонению рейтинга Glicko-2),
+и заканчивает турнир, когда рейтинг всех игроков известен с нужной точностью.
+
+    python -m scheduler swiss -r 10 -w 4 -f --seed 1
+"""
+import argparse
+import logging
+import math
+import os
+import random
+from collections import Counter
+
+import numpy as np
+
+import settings
+from battle import run_battles, save_battle_result
+from battle_cache import BattleCache
+from hangar_index import HangarIndex
+from rating_batch import GLICKO2_INITIAL_DEVIATION, GLICKO2_INITIAL_VOLATILITY, GLICKO2_SCALE, replay_glicko2
+from rating_index import RatingIndex
+from renew_rating import RatingUpdater
+
+
+class Scheduler:
+    """
+    Общая часть планировщиков: учет сыгранных битв и встреч игроков.
+    rating_index - индекс рейтинга (RatingIndex), из которого берется текущий рейтинг игроков.
+    """
+    name = None
+
+    def __init__(self, modules, group_size=2, seed=None, rating_index=None):
+        if not 2 <= group_size <= 4:
+            raise ValueError('Battle group size must be from 2 to 4')
+        if len(modules) < group_size:
+            raise ValueError(f'Need at least {group_size} modules, got {len(modules)}')
+        self.modules = list(modules)
+        self.group_size = group_size
+        self.seed = seed
+        self.rnd = random.Random(seed)
+        self.rating_index = rating_index if rating_index is not None else RatingIndex()
+        self.appearances = Counter()
+        self.meetings = Counter()
+        self.battles_count = 0
+
+    def rating(self, team_module):
+        player = self.rating_index.get_by_path(team_module)
+        return player.rating if player else settings.INITIAL_RATING
+
+    def _spec(self, group):
+        for team_module in group:
+            self.appearances[team_module] += 1
+            for opponent in group:
+                if opponent != team_module:
+                    self.meetings[team_module, opponent] += 1
+        spec = dict(player_modules=list(group))
+        if self.seed is not None:
+            spec['seed'] = self.seed + self.battles_count
+        self.battles_count += 1
+        return spec
+
+    def _group_meetings(self, group, team_module):
+        return sum(self.meetings[member, team_module] for member in group)
+
+    def _make_groups(self, ordered_modules):
+        """
+        Делит игроков, упорядоченных по рейтингу, на группы соседей по рейтингу,
+        по возможности избегая повторных встреч: к группе добирается тот из ближайших по рейтингу игроков,
+        с кем ее участники встречались реже всего.
+        """
+        remaining = list(ordered_modules)
+        groups = []
+        while len(remaining) >= 2:
+            group = [remaining.pop(0)]
+            while len(group) < self.group_size and remaining:
+                window = remaining[:2 * self.group_size]
+                companion = min(window, key=lambda team_module: (self._group_meetings(group, team_module),
+                                                                  window.index(team_module)))
+                remaining.remove(companion)
+                group.append(companion)
+            groups.append(group)
+        return groups
+
+    def next_round(self):
+        """ Спецификации битв следующего раунда, пустой список - турнир окончен """
+        raise NotImplementedError
+
+    def record(self, battle_result):
+        """ Результат сыгранной битвы (для планировщиков, которые ведут свою статистику) """
+
+
+class RoundRobinScheduler(Scheduler):
+    """
+    Круговой турнир: каждый игрок встречается с каждым один раз (битвы один на один).
+    Раунды составляются методом вращения, в каждом раунде каждый игрок играет не больше одной битвы.
+    """
+    name = 'round-robin'
+
+    def __init__(self, modules, group_size=2, **kwargs):
+        if group_size != 2:
+            raise ValueError('Round-robin is available only for battles of two players')
+        super().__init__(modules, group_size=group_size, **kwargs)
+        self._circle = self.modules + ([None] if len(self.modules) % 2 else [])
+        self._round = 0
+
+    @property
+    def rounds_count(self):
+        return len(self._circle) - 1
+
+    def next_round(self):
+        if self._round >= self.rounds_count:
+            return []
+        circle, half = self._circle, len(self._circle) // 2
+        pairs = [(circle[index], circle[-index - 1]) for index in range(half)]
+        self._circle = [circle[0], circle[-1], *circle[1:-1]]
+        self._round += 1
+        return [self._spec(pair) for pair in pairs if None not in pair]
+
+
+class SwissScheduler(Scheduler):
+    """
+    Швейцарская система: в каждом раунде игроки сортируются по текущему рейтингу
+    и играют с ближайшими по рейтингу соперниками, с которыми встречались реже всего.
+    Если игроков не хватает на целые группы, без битвы остаются сыгравшие больше всех.
+    """
+    name = 'swiss'
+
+    def next_round(self):
+        extra = len(self.modules) % self.group_size
+        # остаток меньше двух игроков не может сыграть отдельную битву
+        resting = set()
+        if extra == 1:
+            resting = set(sorted(self.modules, key=lambda team_module: (-self.appearances[team_module],
+                                                                         self.rnd.random()))[:1])
+        playing = [team_module for team_module in self.modules if team_module not in resting]
+        playing.sort(key=lambda team_module: (-self.rating(team_module), self.rnd.random()))
+        return [self._spec(group) for group in self._make_groups(playing)]
+
+
+class LadderScheduler(Scheduler):
+    """
+    Лесенка: непрерывная серия битв, в каждой партии битв играют те, кто сыграл меньше всех,
+    против ближайших к ним по рейтингу соперников. batch_size - битв в партии (обычно по числу процессов).
+    """
+    name = 'ladder'
+
+    def __init__(self, modules, batch_size=None, **kwargs):
+        super().__init__(modules, **kwargs)
+        self.batch_size = batch_size or max(len(self.modules) // self.group_size, 1)
+
+    def next_round(self):
+        ladder = sorted(self.modules, key=lambda team_module: (-self.rating(team_module), team_module))
+        position = {team_module: index for index, team_module in enumerate(ladder)}
+        free = set(self.modules)
+        specs = []
+        for team_module in sorted(self.modules, key=lambda team_module: (self.appearances[team_module],
+                                                                          self.rnd.random())):
+            if len(specs) >= self.batch_size:
+                break
+            if team_module not in free:
+                continue
+            neighbours = sorted(
+                (opponent for opponent in free if opponent != team_module),
+                key=lambda opponent: abs(position[opponent] - position[team_module]),
+            )[:2 * self.group_size]
+            if len(neighbours) < self.group_size - 1:
+                break
+            group = [team_module]
+            while len(group) < self.group_size:
+                companion = min(neighbours, key=lambda opponent: (self._group_meetings(group, opponent),
+                                                                  neighbours.index(opponent)))
+                neighbours.remove(companion)
+                group.append(companion)
+            free -= set(group)
+            specs.append(self._spec(group))
+        return specs
+
+
+def _glicko2_g(phi):
+    return 1 / math.sqrt(1 + 3 * phi ** 2 / math.pi ** 2)
+
+
+class AdaptiveScheduler(Scheduler):
+    """
+    Адаптивный подбор: для каждого игрока ведется рейтинг Glicko-2 с отклонением (неуверенностью в рейтинге),
+    битвы ставятся так, чтобы ожидаемое уменьшение дисперсии рейтингов участников было наибольшим.
+    Больше всего это дают битвы игроков с неуверенным рейтингом против соперников близкой силы
+    с уверенным рейтингом, а заведомо неравные битвы и лишние повторы почти ничего не дают.
+    Турнир кончается, когда отклонение рейтинга всех игроков не больше target_deviation.
+    glicko2_ratings - начальные рейтинги по истории битв (RatingEngine.glicko2_ratings), без них все начинают заново.
+    """
+    name = 'adaptive'
+
+    def __init__(self, modules, batch_size=None, target_deviation=settings.ADAPTIVE_TARGET_DEVIATION,
+                 glicko2_ratings=None, **kwargs):
+        super().__init__(modules, **kwargs)
+        self.batch_size = batch_size or max(len(self.modules) // self.group_size, 1)
+        self.target_deviation = target_deviation
+        self._indexes = {team_module: index for index, team_module in enumerate(self.modules)}
+        self.ratings = np.full(len(self.modules), float(settings.INITIAL_RATING))
+        self.deviations = np.full(len(self.modules), float(GLICKO2_INITIAL_DEVIATION))
+        self.volatilities = np.full(len(self.modules), GLICKO2_INITIAL_VOLATILITY)
+        for team_module, index in self._indexes.items():
+            player = self.rating_index.get_by_path(team_module)
+            if player and glicko2_ratings and player.id in glicko2_ratings:
+                self.ratings[index], self.deviations[index] = glicko2_ratings[player.id]
+
+    def deviation(self, team_module):
+        return float(self.deviations[self._indexes[team_module]])
+
+    def _variance_reduction(self, group):
+        """
+        Ожидаемое уменьшение суммы дисперсий рейтингов участников после битвы (в шкале Glicko-2):
+        информация о рейтинге игрока от партии с соперником - g(phi соперника)^2 * E * (1 - E), как в Glicko-2.
+        """
+        indexes = [self._indexes[team_module] for team_module in group]
+        mu = [(self.ratings[index] - settings.INITIAL_RATING) / GLICKO2_SCALE for index in indexes]
+        phi = [self.deviations[index] / GLICKO2_SCALE for index in indexes]
+        reduction = 0
+        for player, player_phi in enumerate(phi):
+            information = 0
+            for opponent, opponent_phi in enumerate(phi):
+                if opponent == player:
+                    continue
+                g = _glicko2_g(opponent_phi)
+                expectation = 1 / (1 + math.exp(-g * (mu[player] - mu[opponent])))
+                information += g ** 2 * expectation * (1 - expectation)
+            reduction += player_phi ** 2 - 1 / (1 / player_phi ** 2 + information)
+        return reduction
+
+    def next_round(self):
+        uncertain = [team_module for team_module in self.modules if self.deviation(team_module) > self.target_deviation]
+        if not uncertain:
+            return []
+        uncertain.sort(key=lambda team_module: (-self.deviation(team_module), self.rnd.random()))
+        free = set(self.modules)
+        specs = []
+        for team_module in uncertain:
+            if len(specs) >= self.batch_size or len(free) < self.group_size:
+                break
+            if team_module not in free:
+                continue
+            free.discard(team_module)
+            group = [team_module]
+            while len(group) < self.group_size:
+                # повторные встречи тех же соперников уточняют рейтинг хуже, чем ожидается по модели
+                companion = max(sorted(free), key=lambda opponent: (
+                    self._variance_reduction(group + [opponent]) / (1 + self._group_meetings(group, opponent))))
+                free.discard(companion)
+                group.append(companion)
+            specs.append(self._spec(group))
+        return specs
+
+    def record(self, battle_result):
+        players, scores = [], []
+        forfeited = battle_result.get('forfeited') or ()
+        for name, elerium in battle_result['collected'].items():
+            team_module = battle_result['players_modules'][name]
+            if team_module in self._indexes:
+                players.append(self._indexes[team_module])
+                # как в рейтинге: снятой с битвы команде засчитывается 0 (см. models.rated_elerium)
+                scores.append(0 if name in forfeited else elerium)
+        if len(players) > 1:
+            replay_glicko2([players], [scores], self.ratings, self.deviations, self.volatilities)
+
+
+SCHEDULERS = {scheduler.name: scheduler
+              for scheduler in (RoundRobinScheduler, SwissScheduler, LadderScheduler, AdaptiveScheduler)}
+
+
+def play_tournament(scheduler, updater, rounds=None, until_stable=None, workers=None, fork_server=False, cache=None,
+                    on_result=None, **battle_params):
+    """
+    Проводит турнир: раунд за раундом запускает битвы параллельно и обновляет рейтинг по их результатам.
+    Останавливается, когда у планировщика кончились битвы, сыграно rounds раундов
+    или среднее изменение рейтинга участников за раунд стало меньше until_stable.
+    Возвращает количество сыгранных битв, учтенных в рейтинге (без битв, которые уже были в БД).
+    """
+    updater.rating_engine.listeners.append(scheduler.rating_index)
+    played = 0
+    round_index = 0
+    while rounds is None or round_index < rounds:
+        specs = scheduler.next_round()
+        if not specs:
+            break
+        round_index += 1
+        round_modules = {team_module for spec in specs for team_module in spec['player_modules']}
+        ratings_before = {team_module: scheduler.rating(team_module) for team_module in round_modules}
+        specs = [dict(battle_params, **spec) for spec in specs]
+        for result in run_battles(specs, workers=workers, fork_server=fork_server, cache=cache):
+            # результат из кэша битв (тот же турнир с тем же --seed) приходит с прежним uuid - он уже учтен
+            # в рейтинге, и планировщику (для адаптивного - загруженному из БД) второй раз не передается
+            if not updater.update_rating(result):
+                continue
+            scheduler.record(result)
+            if on_result:
+                on_result(result)
+            played += 1
+        rating_change = sum(abs(scheduler.rating(team_module) - rating)
+                            for team_module, rating in ratings_before.items()) / len(ratings_before)
+        logging.info(f'Раунд {round_index}: битв {len(specs)}, среднее изменение рейтинга {rating_change:.1f}')
+        if until_stable is not None and rating_change < until_stable:
+            break
+    return played
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Проводит турнир между всеми командами ангаров (или указанными)')
+    parser.add_argument('mode', choices=list(SCHEDULERS), help='Система турнира')
+    parser.add_argument('-p', '--player-module', type=str, nargs=argparse.ONE_OR_MORE,
+                        help='Модули команд в формате hangar_XXXX/module_name.py (по умолчанию - все)')
+    parser.add_argument('-g', '--group-size', type=int, default=2, help='Команд в одной битве')
+    parser.add_argument('-r', '--rounds', type=int, help='Сколько раундов провести')
+    parser.add_argument('--until-stable', type=float,
+                        help='Остановиться, когда среднее изменение рейтинга за раунд станет меньше этого')
+    parser.add_argument('--batch-size', type=int, help='Битв в одной партии лесенки и адаптивного подбора')
+    parser.add_argument('--target-deviation', type=float, default=settings.ADAPTIVE_TARGET_DEVIATION,
+                        help='Адаптивный подбор идет, пока отклонение рейтинга Glicko-2 у кого-то больше этого')
+    parser.add_argument('-s', '--game-speed', type=int, default=10, help='Скорость битвы')
+    parser.add_argument('-a', '--asteroids-count', type=int, default=10, help='Количество астероидов')
+    parser.add_argument('-d', '--drones-count', type=int, default=5, help='Количество дронов в команде')
+    parser.add_argument('-f', '--fast-forward', action='store_true', help='Прокручивать битвы с максимальной скоростью')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='Количество процессов')
+    parser.add_argument('--fork-server', action='store_true', help='Запускать битвы в форках подготовленного процесса')
+    parser.add_argument('--seed', type=int, help='Начальное зерно случайных чисел, битвы получают seed, seed + 1, ...')
+    parser.add_argument('--no-cache', action='store_true', help='Не использовать кеш результатов битв')
+    parser.add_argument('-od', '--out-dir', type=str, help='Папка для сохранения json-результатов битв')
+    parser.add_argument('-b', '--database', type=str, default=settings.DB_URL,
+                        help=f'URL соединения с БД (если не указано то {settings.DB_URL})')
+    parser.add_argument('-o', '--out-file', type=str, default=settings.RATING_FILE, help='Куда сохранять рейтинг')
+    parser.add_argument('-l', '--log-file', type=str, default=settings.BATTLES_LOG, help='Куда сохранять лог битв')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    astro_rating = RatingUpdater(db_url=args.database, out_file=args.out_file, workers=args.workers)
+    # модули, которые не импортируются или не объявляют drone_class, пропускаются до начала турнира
+    team_modules = HangarIndex(workers=args.workers).valid_modules(args.player_module)
+    scheduler_kwargs = dict(group_size=args.group_size, seed=args.seed, rating_index=RatingIndex.load())
+    if args.mode in (LadderScheduler.name, AdaptiveScheduler.name):
+        scheduler_kwargs['batch_size'] = args.batch_size or args.workers
+    if args.mode == AdaptiveScheduler.name:
+        scheduler_kwargs['target_deviation'] = args.target_deviation
+        scheduler_kwargs['glicko2_ratings'] = astro_rating.rating_engine.glicko2_ratings()
+    tournament_scheduler = SCHEDULERS[args.mode](team_modules, **scheduler_kwargs)
+
+    def save_result(result):
+        if args.out_dir:
+            os.makedirs(args.out_dir, exist_ok=True)
+            save_battle_result(result=result, path=os.path.join(args.out_dir, f"{result['uuid']}.json"))
+
+    battles_played = play_tournament(
+        tournament_scheduler, astro_rating, rounds=args.rounds, until_stable=args.until_stable,
+        workers=args.workers, fork_server=args.fork_server,
+        cache=None if args.no_cache else BattleCache(settings.BATTLE_CACHE_DIR), on_result=save_result,
+        speed=args.game_speed, asteroids_count=args.asteroids_count, drones_count=args.drones_count,
+        fast_forward=args.fast_forward,
+    )
+    astro_rating.write_results_in_file()
+    astro_rating.write_logs_in_file(log_file=args.log_file)
+    print(f'Сыграно битв: {battles_played}')
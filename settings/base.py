@@ -5,8 +5,21 @@ PROJECT_PATH = os.path.dirname(os.path.dirname(__file__))
 
 ELO_COEFFICIENTS = ((1000, 10), (700, 20), )
 INITIAL_RATING = 700
+# через сколько битв сохранять рейтинги всех игроков, чтобы пересчитывать рейтинг не с начала истории
+RATING_CHECKPOINT_INTERVAL = 500
+# хранить ли в БД исходный json результатов битв (сжатым), для рейтинга и логов он не нужен
+STORE_BATTLE_RESULTS = True
 
 DB_URL = f'sqlite:///{PROJECT_PATH}/astro.sqlite'
 
+BATTLE_CACHE_DIR = os.path.join(PROJECT_PATH, '.battle_cache')
+# индекс модулей команд из ангаров (см. hangar_index.py)
+HANGAR_INDEX_FILE = os.path.join(PROJECT_PATH, '.hangar_index.json')
+
 BATTLES_LOG = os.path.join(PROJECT_PATH, 'LOCAL_LOGS.md')
 RATING_FILE = os.path.join(PROJECT_PATH, 'LOCAL_RATING.md')
+QUARANTINE_FILE = os.path.join(PROJECT_PATH, 'LOCAL_QUARANTINE.md')
+# как часто (в секундах) renew_rating.py --watch перезаписывает рейтинг и лог битв
+REPORT_INTERVAL = 10
+# адаптивный подбор битв (scheduler.py adaptive) идет, пока отклонение рейтинга Glicko-2 у кого-то больше этого
+ADAPTIVE_TARGET_DEVIATION = 80
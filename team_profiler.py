@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+import time
+from collections import Counter, defaultdict
+
+# обработчики, которые вызывает движок (on_stop_at_target сам вызывает on_stop_at_asteroid и прочие)
+ENGINE_HANDLERS = (
+    'on_born', 'on_stop', 'on_stop_at_target', 'on_collide_with', 'on_overlap_with',
+    'on_hearbeat', 'on_wake_up', 'on_load_complete', 'on_unload_complete',
+)
+# длительности вызовов копятся в гистограмме, а не списком: память не растет с длиной битвы.
+# Границы корзин растут в HISTOGRAM_RATIO раз начиная с HISTOGRAM_MIN секунд, p99 считается с точностью до корзины
+HISTOGRAM_MIN = 1e-6
+HISTOGRAM_RATIO = 2 ** (1 / 8)
+
+
+def _skip_handler(*args, **kwargs):
+    pass
+
+
+def _bucket(duration):
+    if duration <= HISTOGRAM_MIN:
+        return 0
+    return int(math.log(duration / HISTOGRAM_MIN, HISTOGRAM_RATIO)) + 1
+
+
+def _bucket_upper_bound(bucket):
+    return HISTOGRAM_MIN * HISTOGRAM_RATIO ** bucket
+
+
+def _percentile(histogram, calls, fraction):
+    """ Верхняя граница корзины, в которую попадает вызов номер fraction * (calls - 1) по возрастанию длительности """
+    rank = int(fraction * (calls - 1))
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen > rank:
+            return _bucket_upper_bound(bucket)
+    return 0.0
+
+
+class TeamProfiler:
+    """
+    Замеряет процессорное время, которое команды тратят в своих обработчиках событий.
+    Если задан cpu_budget (секунд на команду за битву), превысившая его команда снимается с битвы:
+    ее дроны останавливаются и больше не получают событий.
+    Вызов обработчика из обработчика той же команды учитывается один раз, а время обработчика другой команды,
+    вызванного изнутри (синхронный колбэк движка), идет на счет той команды, чей обработчик выполняется.
+    """
+
+    def __init__(self, cpu_budget=None):
+        self.cpu_budget = cpu_budget
+        self.histograms = defaultdict(Counter)
+        self.handler_calls = defaultdict(int)
+        self.cpu_seconds = defaultdict(float)
+        self.forfeited = []
+        self._drones = defaultdict(list)
+        # выполняющиеся сейчас обработчики: [команда, когда пошли часы, сколько уже набежало до паузы]
+        self._running = []
+
+    def watch(self, drone):
+        team = drone.team
+        self._drones[team].append(drone)
+        for name in ENGINE_HANDLERS:
+            setattr(drone, name, self._timed(team, getattr(drone, name)))
+
+    def _timed(self, team, handler):
+        def timed_handler(*args, **kwargs):
+            running = self._running
+            if running and running[-1][0] == team:
+                # обработчик вызван из обработчика той же команды - время уже учитывается снаружи
+                return handler(*args, **kwargs)
+            started_at = time.process_time()
+            if running:
+                # обработчик другой команды (синхронный вызов из движка): часы внешней команды на паузе
+                outer = running[-1]
+                outer[2] += started_at - outer[1]
+            frame = [team, started_at, 0.0]
+            running.append(frame)
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                finished_at = time.process_time()
+                running.pop()
+                if running:
+                    running[-1][1] = finished_at
+                duration = frame[2] + finished_at - frame[1]
+                self.histograms[team][_bucket(duration)] += 1
+                self.handler_calls[team] += 1
+                self.cpu_seconds[team] += duration
+                if self.cpu_budget is not None and self.cpu_seconds[team] > self.cpu_budget:
+                    self.forfeit(team)
+        return timed_handler
+
+    def forfeit(self, team):
+        if team in self.forfeited:
+            return
+        logging.warning(f'Команда {team} превысила бюджет {self.cpu_budget} с процессорного времени и снята с битвы')
+        self.forfeited.append(team)
+        for drone in self._drones[team]:
+            for name in ENGINE_HANDLERS:
+                setattr(drone, name, _skip_handler)
+            drone.stop()
+
+    def get_stats(self):
+        stats = {}
+        for team, calls in self.handler_calls.items():
+            stats[team] = dict(
+                cpu_seconds=round(self.cpu_seconds[team], 3),
+                handler_calls=calls,
+                p99_handler_ms=round(_percentile(self.histograms[team], calls, .99) * 1000, 3),
+            )
+        return stats
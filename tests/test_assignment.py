@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+from drone_toolkit.assignment import collection_costs, solve
+
+
+def brute_force(costs):
+    """ Перебор всех назначений: больше разрешенных пар, при равном числе пар - меньше сумма затрат """
+    rows, columns = costs.shape
+    best = None
+    for permutation in itertools.permutations(range(max(rows, columns)), min(rows, columns)):
+        pairs = zip(range(rows), permutation) if rows <= columns else zip(permutation, range(columns))
+        pairs = [(row, column) for row, column in pairs if np.isfinite(costs[row, column])]
+        key = -len(pairs), sum(costs[row, column] for row, column in pairs)
+        if best is None or key < best:
+            best = key
+    return best
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_solve_matches_brute_force(seed):
+    rnd = np.random.default_rng(seed)
+    for _ in range(300):
+        rows, columns = (int(size) for size in rnd.integers(1, 6, 2))
+        costs = rnd.random((rows, columns)) * 10
+        if rnd.random() < .3:
+            costs[rnd.random((rows, columns)) < .3] = np.inf
+        if rnd.random() < .2:
+            # равные затраты - несколько оптимальных назначений
+            costs = np.round(costs)
+        assigned_rows, assigned_columns = solve(costs)
+        assert len(set(assigned_rows)) == len(assigned_rows)
+        assert len(set(assigned_columns)) == len(assigned_columns)
+        assert (np.diff(assigned_rows) > 0).all()
+        assert np.isfinite(costs[assigned_rows, assigned_columns]).all()
+        pairs_count, total = brute_force(costs)
+        assert len(assigned_rows) == -pairs_count
+        assert costs[assigned_rows, assigned_columns].sum() == pytest.approx(total)
+
+
+def test_solve_degenerate_matrices():
+    for costs in (np.zeros((0, 3)), np.zeros((3, 0)), np.full((2, 2), np.inf)):
+        assigned_rows, assigned_columns = solve(costs)
+        assert len(assigned_rows) == len(assigned_columns) == 0
+
+
+def test_collection_costs():
+    rnd = np.random.default_rng(1)
+    drones, sources, bases = rnd.random((4, 2)) * 1200, rnd.random((6, 2)) * 1200, rnd.random((4, 2)) * 1200
+    free_spaces, amounts = [0, 50, 100, 100], [0, 30, 100, 200, 100, 80]
+    costs = collection_costs(drones, free_spaces, sources, amounts, bases)
+    for drone_index, source_index in itertools.product(range(4), range(6)):
+        taken = min(free_spaces[drone_index], amounts[source_index])
+        path = math.dist(drones[drone_index], sources[source_index]) + \
+            math.dist(sources[source_index], bases[drone_index])
+        expected = path / taken if taken > 0 else math.inf
+        assert costs[drone_index, source_index] == pytest.approx(expected)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+
+import numpy as np
+import pytest
+from robogame_engine.geometry import Point
+
+from drone_toolkit import geometry
+
+
+def random_points(rnd, count):
+    return [(rnd.uniform(-100, 1300), rnd.uniform(-100, 1300)) for _ in range(count)]
+
+
+def segment_distance(start, end, point):
+    """ Расстояние до отрезка по одной точке, через ближайшую из плотно расставленных на отрезке точек """
+    samples = np.linspace(0, 1, 20001)[:, None] * np.subtract(end, start) + start
+    return np.sqrt(((samples - point) ** 2).sum(axis=1)).min()
+
+
+@pytest.fixture
+def rnd():
+    return random.Random(1)
+
+
+def test_inputs_of_any_form_give_the_same_points(rnd):
+    pairs = random_points(rnd, 10)
+    expected = np.array(pairs)
+    assert (geometry.as_points(pairs) == expected).all()
+    assert (geometry.as_points([Point(x, y) for x, y in pairs]) == expected).all()
+    assert (geometry.as_points(expected.ravel()) == expected).all()
+    assert geometry.as_points([]).shape == (0, 2)
+
+
+def test_distances_match_point_distance_to(rnd):
+    points, others = random_points(rnd, 30), random_points(rnd, 20)
+    expected = [[Point(*point).distance_to(Point(*other)) for other in others] for point in points]
+    np.testing.assert_allclose(geometry.distance_matrix(points, others), expected)
+    np.testing.assert_allclose(geometry.distances(Point(*points[0]), others), expected[0])
+
+
+def test_distances_to_segment_match_dense_sampling(rnd):
+    for _ in range(20):
+        start, end = random_points(rnd, 2)
+        if rnd.random() < .2:
+            end = start
+        points = random_points(rnd, 20)
+        expected = [segment_distance(start, end, point) for point in points]
+        np.testing.assert_allclose(geometry.distances_to_segment(start, end, points), expected, atol=.1)
+
+
+def test_segment_circle_intersections_lie_on_circles(rnd):
+    for _ in range(20):
+        start, end = random_points(rnd, 2)
+        centers = random_points(rnd, 30)
+        radii = np.array([rnd.uniform(10, 300) for _ in centers])
+        enter, leave = geometry.segment_circle_intersections(start, end, centers, radii)
+        direction, offsets = np.subtract(end, start), np.subtract(centers, start)
+        line_distances = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / math.dist(start, end)
+        # прямая пересекает окружность, только если проходит ближе радиуса от центра
+        assert (np.isnan(enter) == (line_distances > radii)).all()
+        crossing = ~np.isnan(enter)
+        for parameters in (enter, leave):
+            points = np.add(start, parameters[crossing][:, None] * np.subtract(end, start))
+            np.testing.assert_allclose(np.sqrt(((points - np.array(centers)[crossing]) ** 2).sum(axis=1)),
+                                       radii[crossing])
+        hits = geometry.segment_hits_circles(start, end, centers, radii)
+        expected = [segment_distance(start, end, center) < radius for center, radius in zip(centers, radii)]
+        # на самой границе плотная выборка может ошибиться, таких окружностей в случайных данных нет
+        assert hits.tolist() == expected
+
+
+def test_ring_points():
+    center, facing = (600, 600), (900, 200)
+    points = geometry.ring_points(center, 100, 12, facing=facing)
+    np.testing.assert_allclose(geometry.distances(center, points), 100)
+    # первая точка смотрит на facing
+    np.testing.assert_allclose(points[0], np.add(center, np.subtract(facing, center) / 5))
+    arc = geometry.ring_points(center, 100, 5, facing=facing, arc=math.pi / 2)
+    np.testing.assert_allclose(arc[2], points[0])
+    np.testing.assert_allclose(math.dist(arc[0], arc[-1]), 100 * math.sqrt(2))
+
+
+def test_field_checks(rnd):
+    points = random_points(rnd, 200)
+    size = (1200, 1000)
+    expected = [20 < x < 1180 and 20 < y < 980 for x, y in points]
+    assert geometry.inside_field(points, margin=20, size=size).tolist() == expected
+    clipped = geometry.clip_to_field(points, margin=20, size=size)
+    assert geometry.inside_field(clipped, margin=19.999, size=size).all()
+    inside = np.array(expected)
+    np.testing.assert_array_equal(clipped[inside], np.array(points)[inside])
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+
+import numpy as np
+
+from drone_toolkit import geometry, line_of_fire
+
+RADIUS = 40
+
+
+def random_points(rnd, count):
+    return [(rnd.uniform(0, 1200), rnd.uniform(0, 1200)) for _ in range(count)]
+
+
+def sampled_distance(start, end, obstacle):
+    """ Расстояние от препятствия до линии огня по плотно расставленным на ней точкам """
+    samples = np.linspace(0, 1, 5001)[:, None] * np.subtract(end, start) + start
+    return np.sqrt(((samples - obstacle) ** 2).sum(axis=1)).min()
+
+
+def projection_parameter(start, end, obstacle):
+    direction, offset = np.subtract(end, start), np.subtract(obstacle, start)
+    return offset @ direction / (direction @ direction)
+
+
+def test_blocking_mask_matches_dense_sampling():
+    rnd = random.Random(1)
+    checked = 0
+    for _ in range(100):
+        start, end = random_points(rnd, 2)
+        obstacles = random_points(rnd, 20) + [start, end]
+        for include_ends in (True, False):
+            mask = line_of_fire.blocking_mask(start, end, obstacles, RADIUS, include_ends=include_ends)
+            for blocked, obstacle in zip(mask, obstacles):
+                distance = sampled_distance(start, end, obstacle)
+                if abs(distance - RADIUS) < .5:
+                    # на самой границе плотная выборка может ошибиться
+                    continue
+                expected = distance < RADIUS
+                if not include_ends:
+                    expected = expected and 0 <= projection_parameter(start, end, obstacle) <= 1
+                assert blocked == expected
+                checked += 1
+        assert line_of_fire.is_line_clear(start, end, obstacles[:-2], RADIUS) == \
+            (not line_of_fire.blocking_mask(start, end, obstacles[:-2], RADIUS).any())
+    assert checked > 3000
+
+
+def test_no_obstacles():
+    assert line_of_fire.blocking_mask((0, 0), (100, 100), [], RADIUS).shape == (0,)
+    assert line_of_fire.is_line_clear((0, 0), (100, 100), [], RADIUS)
+
+
+def test_safe_firing_position_is_nearest_clear_candidate():
+    rnd = random.Random(2)
+    found = 0
+    for _ in range(100):
+        shooter, target = random_points(rnd, 2)
+        obstacles = random_points(rnd, rnd.randint(0, 8))
+        # союзники прямо на линии огня
+        obstacles += [np.add(shooter, np.subtract(target, shooter) * rnd.random()) for _ in range(2)]
+        position = line_of_fire.safe_firing_position(shooter, target, obstacles, RADIUS, margin=20)
+        distance = math.dist(shooter, target)
+        candidates = geometry.ring_points(target, distance, 36, facing=shooter)
+        clear = [candidate for candidate in candidates
+                 if geometry.inside_field([candidate], margin=20)[0]
+                 and all(sampled_distance(candidate, target, obstacle) >= RADIUS for obstacle in obstacles)]
+        if not clear:
+            assert position is None
+            continue
+        found += 1
+        expected = min(clear, key=lambda candidate: math.dist(candidate, shooter))
+        np.testing.assert_allclose((position.x, position.y), expected)
+        np.testing.assert_allclose(math.dist((position.x, position.y), target), distance)
+    assert found > 50
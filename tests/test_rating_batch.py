@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import datetime
+import random
+
+import numpy as np
+import pytest
+
+from models import BattleParticipant, Player
+from rating_batch import GLICKO2_INITIAL_DEVIATION, GLICKO2_INITIAL_VOLATILITY, replay_elo, replay_glicko2
+from rating_engine import elo_changes
+from renew_rating import RatingUpdater
+import settings
+
+PLAYERS_COUNT = 7
+
+
+def random_battles(rnd, count):
+    """ Результаты битв по 2-4 команды, часть битв в одну и ту же секунду (порядок тогда - по uuid) """
+    battles = []
+    happened_at = datetime.datetime(2021, 1, 1)
+    for index in range(count):
+        if rnd.random() < .7:
+            happened_at += datetime.timedelta(seconds=rnd.randint(1, 100))
+        names = rnd.sample([f'Team{number}' for number in range(PLAYERS_COUNT)], rnd.randint(2, 4))
+        battles.append(dict(
+            uuid=f'{rnd.getrandbits(64):016x}',
+            happened_at=happened_at.strftime('%Y-%m-%d %H:%M:%S'),
+            game_steps=rnd.randint(1000, 10000),
+            # равные и почти равные результаты тоже нужны - это ничьи
+            collected={name: rnd.choice((0, 100, 102, 500, rnd.randint(0, 2000))) for name in names},
+            dead={name: rnd.randint(0, 5) for name in names},
+            players_modules={name: f'hangar_test/{name.lower()}.py' for name in names},
+        ))
+    return battles
+
+
+def history_matrices(battles, names):
+    indexes = {name: index for index, name in enumerate(names)}
+    players = np.full((len(battles), 4), -1, dtype=np.int64)
+    scores = np.zeros((len(battles), 4))
+    for battle_index, battle in enumerate(battles):
+        for place, (name, elerium) in enumerate(battle['collected'].items()):
+            players[battle_index, place] = indexes[name]
+            scores[battle_index, place] = elerium
+    return players, scores
+
+
+def rating_state():
+    players = dict(Player.select(Player.name, Player.rating).tuples())
+    participants = sorted(BattleParticipant.select(
+        BattleParticipant.battle, BattleParticipant.player, BattleParticipant.rating_before,
+        BattleParticipant.rating_after,
+    ).tuples())
+    return players, participants
+
+
+@pytest.fixture
+def updater(tmp_path):
+    return RatingUpdater(db_url=f'sqlite:///{tmp_path}/astro.sqlite', out_file=str(tmp_path / 'RATING.md'))
+
+
+def test_replay_elo_matches_elo_changes():
+    battles = random_battles(random.Random(1), 300)
+    names = [f'Team{number}' for number in range(PLAYERS_COUNT)]
+    expected = {name: settings.INITIAL_RATING for name in names}
+    expected_after = []
+    for battle in battles:
+        changes = elo_changes(player_scores=battle['collected'], ratings=expected)
+        expected = dict(expected, **{name: expected[name] + change for name, change in changes.items()})
+        expected_after.append([expected[name] for name in battle['collected']])
+
+    players, scores = history_matrices(battles, names)
+    ratings = np.full(len(names), settings.INITIAL_RATING, dtype=np.int64)
+    _, ratings_after, _ = replay_elo(players, scores, ratings)
+    assert [row[players[index] >= 0].tolist() for index, row in enumerate(ratings_after)] == expected_after
+    assert dict(zip(names, ratings.tolist())) == expected
+
+
+def test_recompute_matches_incremental_updates(updater):
+    rnd = random.Random(2)
+    battles = random_battles(rnd, 120)
+    # битвы приходят не по порядку истории: часть вставляется в прошлое и пересчитывает историю после себя
+    for battle in sorted(battles, key=lambda battle: rnd.random() if rnd.random() < .2 else 0):
+        updater.update_rating(battle)
+    incremental = rating_state()
+
+    updater.rating_engine.recompute_from()
+    assert rating_state() == incremental
+
+
+def test_glicko2_battle_by_battle_matches_batch():
+    battles = random_battles(random.Random(3), 200)
+    names = [f'Team{number}' for number in range(PLAYERS_COUNT)]
+    players, scores = history_matrices(battles, names)
+
+    def initial():
+        return (np.full(len(names), float(settings.INITIAL_RATING)),
+                np.full(len(names), float(GLICKO2_INITIAL_DEVIATION)),
+                np.full(len(names), GLICKO2_INITIAL_VOLATILITY))
+
+    batch = replay_glicko2(players, scores, *initial())
+    incremental = initial()
+    for battle_players, battle_scores in zip(players, scores):
+        replay_glicko2([battle_players], [battle_scores], *incremental)
+    for batch_values, incremental_values in zip(batch, incremental):
+        np.testing.assert_allclose(batch_values, incremental_values, rtol=1e-12)
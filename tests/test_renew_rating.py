@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from models import Battle, Player
+from renew_rating import RatingUpdater
+from result_reader import check_battle_result
+
+
+def battle_result(number, **changes):
+    result = dict(
+        uuid=f'battle-{number:03d}',
+        happened_at=f'2021-01-01 10:{number // 60:02d}:{number % 60:02d}',
+        game_steps=1000,
+        collected={'RedDrone': 100 * number, 'BlueDrone': 50},
+        dead={'RedDrone': 0, 'BlueDrone': 5},
+        players_modules={'RedDrone': 'hangar_test/red.py', 'BlueDrone': 'hangar_test/blue.py'},
+    )
+    result.update(changes)
+    return result
+
+
+BROKEN = dict(
+    null_date=dict(happened_at=None),
+    number_date=dict(happened_at=20210101),
+    malformed_date=dict(happened_at='yesterday'),
+    text_elerium=dict(collected={'RedDrone': '100', 'BlueDrone': 50}),
+    null_elerium=dict(collected={'RedDrone': None, 'BlueDrone': 50}),
+    list_collected=dict(collected=['RedDrone', 'BlueDrone']),
+    missed_module=dict(players_modules={'RedDrone': 'hangar_test/red.py'}),
+    text_dead=dict(dead={'RedDrone': 'all', 'BlueDrone': 5}),
+)
+
+
+@pytest.fixture
+def updater(tmp_path):
+    return RatingUpdater(db_url=f'sqlite:///{tmp_path}/astro.sqlite', out_file=str(tmp_path / 'RATING.md'), workers=1)
+
+
+def write_results(path, results):
+    path.mkdir()
+    for name, result in results.items():
+        (path / f'{name}.json').write_text(json.dumps(result))
+    return path
+
+
+@pytest.mark.parametrize('changes', BROKEN.values(), ids=list(BROKEN))
+def test_check_battle_result_rejects_badly_typed_values(changes):
+    check_battle_result(battle_result(1))
+    with pytest.raises(ValueError):
+        check_battle_result(battle_result(1, **changes))
+
+
+def test_team_missing_from_dead_is_accepted():
+    check_battle_result(battle_result(1, dead={'BlueDrone': 5}))
+
+
+def test_broken_files_are_quarantined_one_by_one(updater, tmp_path):
+    results = {f'good_{number}': battle_result(number) for number in range(5)}
+    results.update({name: battle_result(10 + index, **changes) for index, (name, changes) in enumerate(BROKEN.items())})
+    updater.renew_from_directory(str(write_results(tmp_path / 'results', results)))
+    assert Battle.select().count() == 5
+    assert sorted(file_name.rsplit('/', 1)[-1] for file_name, _ in updater.quarantine.files) == \
+        sorted(f'{name}.json' for name in BROKEN)
+    assert Player.select().count() == 2
+
+
+def test_bulk_load_quarantines_broken_battles_and_keeps_the_rest(updater, tmp_path):
+    results = {f'good_{number}': battle_result(number) for number in range(5)}
+    results.update({name: battle_result(10 + index, **changes) for index, (name, changes) in enumerate(BROKEN.items())})
+    # проходит проверку при чтении, но строки участников для нее не построить
+    results['bad_forfeited'] = battle_result(30, forfeited=5)
+    loaded = updater.bulk_renew_from_directory(str(write_results(tmp_path / 'results', results)))
+    assert loaded == Battle.select().count() == 5
+    assert sorted(file_name.rsplit('/', 1)[-1] for file_name, _ in updater.quarantine.files) == \
+        sorted(f'{name}.json' for name in list(BROKEN) + ['bad_forfeited'])
+    ratings = dict(Player.select(Player.name, Player.rating).tuples())
+
+    updater.rating_engine.recompute_from()
+    assert dict(Player.select(Player.name, Player.rating).tuples()) == ratings
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+import pytest
+
+from renew_rating import RatingUpdater
+
+TODAY = datetime.date.today()
+
+
+def battle_result(number, minutes):
+    happened_at = datetime.datetime.combine(TODAY, datetime.time()) + datetime.timedelta(minutes=minutes)
+    return dict(
+        uuid=f'battle-{number:03d}',
+        happened_at=happened_at.strftime('%Y-%m-%d %H:%M:%S'),
+        game_steps=1000 + number,
+        collected={'RedDrone': 10 * number, 'BlueDrone': 50},
+        dead={'RedDrone': 0, 'BlueDrone': number % 2},
+        players_modules={'RedDrone': 'hangar_test/red.py', 'BlueDrone': 'hangar_test/blue.py'},
+    )
+
+
+@pytest.fixture
+def updater(tmp_path):
+    return RatingUpdater(db_url=f'sqlite:///{tmp_path}/astro.sqlite', out_file=str(tmp_path / 'RATING.md'))
+
+
+def full_log(updater, path):
+    updater.reports.invalidate()
+    updater.reports.write_log(path, today=TODAY)
+    with open(path) as ff:
+        return ff.read()
+
+
+def test_new_battles_are_appended(updater, tmp_path):
+    log_file = str(tmp_path / 'LOGS.md')
+    text = ''
+    for number in range(1, 6):
+        updater.update_rating(battle_result(number, minutes=number))
+        assert updater.reports.write_log(log_file, today=TODAY) == 1
+        with open(log_file) as ff:
+            previous, text = text, ff.read()
+        # старые строки на месте, новая битва - в конце
+        assert text.startswith(previous) and text.count('\n') == previous.count('\n') + (5 if number == 1 else 1)
+    assert updater.reports.write_log(log_file, today=TODAY) == 0
+    assert text == full_log(updater, str(tmp_path / 'FULL.md'))
+    assert [row.split(' | ')[1] for row in text.splitlines()[4:]] == ['1001', '1002', '1003', '1004', '1005']
+
+
+def test_battle_from_the_past_rewrites_the_log(updater, tmp_path):
+    log_file = str(tmp_path / 'LOGS.md')
+    for number, minutes in ((1, 10), (2, 20)):
+        updater.update_rating(battle_result(number, minutes))
+    updater.reports.write_log(log_file, today=TODAY)
+    updater.update_rating(battle_result(3, minutes=5))
+    assert updater.reports.write_log(log_file, today=TODAY) == 3
+    with open(log_file) as ff:
+        rows = ff.read().splitlines()[4:]
+    assert [row.split(' | ')[1] for row in rows] == ['1003', '1001', '1002']
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+import numpy as np
+import pytest
+
+import scheduler
+from rating_index import RatingIndex
+from renew_rating import RatingUpdater
+
+MODULES = [f'hangar_test/team_{number}.py' for number in range(4)]
+
+
+def fake_run_battles(specs, **kwargs):
+    """ Результат битвы определяется ее seed, как у результата из кэша битв - с тем же uuid """
+    for spec in specs:
+        seed = spec['seed']
+        names = [team_module.rsplit('/', 1)[-1][:-3] for team_module in spec['player_modules']]
+        yield dict(
+            uuid=f'battle-{seed}',
+            happened_at=(datetime.datetime(2021, 1, 1) + datetime.timedelta(minutes=seed)).strftime(
+                '%Y-%m-%d %H:%M:%S'),
+            game_steps=1000,
+            collected={name: 100 * ((seed + index) % 3) for index, name in enumerate(names)},
+            dead={name: 0 for name in names},
+            players_modules=dict(zip(names, spec['player_modules'])),
+        )
+
+
+@pytest.fixture
+def updater(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, 'run_battles', fake_run_battles)
+    return RatingUpdater(db_url=f'sqlite:///{tmp_path}/astro.sqlite', out_file=str(tmp_path / 'RATING.md'))
+
+
+def adaptive_scheduler(updater):
+    return scheduler.AdaptiveScheduler(MODULES, seed=1, batch_size=2, rating_index=RatingIndex.load(),
+                                       glicko2_ratings=updater.rating_engine.glicko2_ratings())
+
+
+def test_battles_already_in_rating_are_not_recorded_again(updater):
+    results = []
+    assert scheduler.play_tournament(adaptive_scheduler(updater), updater, rounds=3, on_result=results.append) == 6
+    assert len(results) == 6
+
+    # тот же турнир с тем же seed: все результаты - уже учтенные битвы
+    repeated = adaptive_scheduler(updater)
+    ratings, deviations = repeated.ratings.copy(), repeated.deviations.copy()
+    results = []
+    assert scheduler.play_tournament(repeated, updater, rounds=3, on_result=results.append) == 0
+    assert results == []
+    np.testing.assert_array_equal(repeated.ratings, ratings)
+    np.testing.assert_array_equal(repeated.deviations, deviations)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import math
+import random
+
+import pytest
+from robogame_engine.geometry import Point
+
+from drone_toolkit.spatial import SpatialGrid
+
+FIELD_SIZE = (1200, 1200)
+
+
+class Thing:
+
+    def __init__(self, x, y, payload=0):
+        self.coord = Point(x, y)
+        self.payload = payload
+
+
+class Rock(Thing):
+    pass
+
+
+def distance(point, obj):
+    return math.sqrt((point[0] - obj.coord.x) ** 2 + (point[1] - obj.coord.y) ** 2)
+
+
+def brute_force(objects, point, kind=None, predicate=None, max_distance=None):
+    """ Как sorted(objects, key=distance_to): при равных расстояниях - в порядке добавления """
+    found = [obj for obj in objects
+             if (kind is None or isinstance(obj, kind)) and (predicate is None or predicate(obj))]
+    found = sorted(found, key=lambda obj: distance(point, obj))
+    if max_distance is not None:
+        found = [obj for obj in found if distance(point, obj) <= max_distance]
+    return found
+
+
+def random_objects(rnd, count):
+    # целые координаты на крупном шаге - много равных расстояний; часть объектов за краем поля
+    return [rnd.choice((Thing, Rock))(rnd.randrange(-100, 1300, 50), rnd.randrange(-100, 1300, 50),
+                                      payload=rnd.randint(0, 1)) for _ in range(count)]
+
+
+def random_point(rnd):
+    return rnd.choice(((rnd.uniform(-50, 1250), rnd.uniform(-50, 1250)), (rnd.randrange(0, 1200, 50), 600)))
+
+
+@pytest.mark.parametrize('cell_size', [37, 100, 2000])
+def test_nearest_matches_brute_force(cell_size):
+    rnd = random.Random(cell_size)
+    objects = random_objects(rnd, 300)
+    grid = SpatialGrid(FIELD_SIZE, cell_size=cell_size)
+    grid.sync(objects)
+    for _ in range(200):
+        point = random_point(rnd)
+        k = rnd.choice((1, 3, 10, 500))
+        kind = rnd.choice((None, Rock))
+        predicate = rnd.choice((None, lambda obj: obj.payload > 0))
+        max_distance = rnd.choice((None, 150, 400))
+        expected = brute_force(objects, point, kind, predicate, max_distance)[:k]
+        assert grid.nearest(point, k=k, kind=kind, predicate=predicate, max_distance=max_distance) == expected
+
+
+@pytest.mark.parametrize('cell_size', [37, 100])
+def test_within_matches_brute_force(cell_size):
+    rnd = random.Random(cell_size)
+    objects = random_objects(rnd, 300)
+    grid = SpatialGrid(FIELD_SIZE, cell_size=cell_size)
+    for obj in objects:
+        grid.add(obj)
+    for _ in range(200):
+        point = random_point(rnd)
+        radius = rnd.choice((0, 50, 120, 700))
+        kind = rnd.choice((None, Thing, Rock))
+        assert grid.within(point, radius, kind=kind) == brute_force(objects, point, kind=kind, max_distance=radius)
+
+
+def test_sync_follows_moved_and_removed_objects():
+    rnd = random.Random(1)
+    objects = random_objects(rnd, 200)
+    grid = SpatialGrid(FIELD_SIZE)
+    grid.sync(objects)
+    for _ in range(20):
+        for obj in rnd.sample(objects, 50):
+            obj.coord = Point(rnd.uniform(0, 1200), rnd.uniform(0, 1200))
+        objects = [obj for obj in objects if rnd.random() > .05]
+        grid.sync(objects)
+        assert len(grid) == len(objects)
+        point = random_point(rnd)
+        assert grid.nearest(point, k=5) == brute_force(objects, point)[:5]
+        assert grid.within(point, 200) == brute_force(objects, point, max_distance=200)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import random
+from types import SimpleNamespace
+
+from astrobox.core import Asteroid, Drone, MotherShip
+from robogame_engine.geometry import Point
+
+from drone_toolkit.world import WorldSnapshot
+
+
+def fake(base):
+    """ Объект игры без сцены и движка: только то, что читает снимок """
+
+    class Fake(base):
+        is_alive = payload = team = None
+
+        def __init__(self, coord, team=None, is_alive=True, payload=0):
+            self.coord, self.team, self.is_alive, self.payload = coord, team, is_alive, payload
+
+    return Fake
+
+
+FakeDrone, FakeAsteroid, FakeMotherShip = fake(Drone), fake(Asteroid), fake(MotherShip)
+TEAMS = ('Red', 'Green', 'Blue')
+
+
+def random_scene(rnd):
+    objects = []
+    for _ in range(80):
+        coord = Point(rnd.uniform(0, 1200), rnd.uniform(0, 1200))
+        kind = rnd.choice((FakeDrone, FakeAsteroid, FakeMotherShip, SimpleNamespace))
+        if kind is SimpleNamespace:
+            # снаряды, взрывы и прочие объекты сцены в снимок не попадают
+            objects.append(SimpleNamespace(coord=coord))
+            continue
+        objects.append(kind(coord, team=rnd.choice(TEAMS), is_alive=rnd.random() < .7, payload=rnd.choice((0, 50))))
+    return SimpleNamespace(objects=objects, _step=0)
+
+
+def test_snapshot_lists_match_filtering_scene_objects():
+    rnd = random.Random(1)
+    scene = random_scene(rnd)
+    world = WorldSnapshot.get(scene)
+    drones = [obj for obj in scene.objects if isinstance(obj, Drone)]
+    motherships = [obj for obj in scene.objects if isinstance(obj, MotherShip)]
+    assert world.asteroids == [obj for obj in scene.objects if isinstance(obj, Asteroid)]
+    assert world.non_empty_asteroids == [asteroid for asteroid in world.asteroids if asteroid.payload]
+    assert world.wrecks == [drone for drone in drones if not drone.is_alive and drone.payload] + \
+        [mothership for mothership in motherships if not mothership.is_alive and mothership.payload]
+    for team in TEAMS:
+        assert world.teammates(team) == [drone for drone in drones if drone.is_alive and drone.team == team]
+        assert world.enemies(team) == [drone for drone in drones if drone.is_alive and drone.team != team]
+        assert world.dead_enemies(team) == [drone for drone in drones if not drone.is_alive and drone.team != team]
+        assert world.enemy_bases(team) == [mothership for mothership in motherships
+                                           if mothership.is_alive and mothership.team != team]
+        assert world.dead_enemy_bases(team) == [mothership for mothership in motherships
+                                                if not mothership.is_alive and mothership.team != team]
+
+
+def test_snapshot_is_rebuilt_once_per_step():
+    rnd = random.Random(2)
+    scene = random_scene(rnd)
+    world = WorldSnapshot.get(scene)
+    unit = SimpleNamespace(scene=scene)
+    assert WorldSnapshot.of(unit) is world
+    drone = next(obj for obj in scene.objects if isinstance(obj, Drone) and obj.is_alive)
+    drone.is_alive = False
+    # в том же шаге снимок не меняется
+    assert drone in WorldSnapshot.get(scene).alive_drones
+    scene._step += 1
+    assert drone not in WorldSnapshot.get(scene).alive_drones
+
+
+def test_grid_follows_moving_units():
+    rnd = random.Random(3)
+    scene = random_scene(rnd)
+    for _ in range(10):
+        world = WorldSnapshot.get(scene)
+        point = Point(rnd.uniform(0, 1200), rnd.uniform(0, 1200))
+        expected = sorted(world.units, key=point.distance_to)[:5]
+        assert world.grid.nearest(point, k=5) == expected
+        for unit in world.drones:
+            unit.coord = Point(rnd.uniform(0, 1200), rnd.uniform(0, 1200))
+        scene._step += 1